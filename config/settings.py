@@ -1,4 +1,3 @@
-import logging
 import os
 from pathlib import Path
 
@@ -30,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'service.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -120,6 +120,25 @@ EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', False) == 'True'
 SERVER_EMAIL = EMAIL_HOST_USER
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+MAILING_SMTP_POOL_SIZE = int(os.getenv('MAILING_SMTP_POOL_SIZE', 4))
+MAILING_WORKERS = int(os.getenv('MAILING_WORKERS', MAILING_SMTP_POOL_SIZE))
+MAILING_RATE_LIMIT = float(os.getenv('MAILING_RATE_LIMIT', 0))
+MAILING_BATCH_SIZE = int(os.getenv('MAILING_BATCH_SIZE', 100))
+MAILING_BATCH_MODE = os.getenv('MAILING_BATCH_MODE', 'bcc')
+MAILING_SHARDS = int(os.getenv('MAILING_SHARDS', 16))
+MAILING_SHARD_LEASE = int(os.getenv('MAILING_SHARD_LEASE', 180))
+MAILING_QUEUE_CLAIM = int(os.getenv('MAILING_QUEUE_CLAIM', 50))
+MAILING_QUEUE_POLL = int(os.getenv('MAILING_QUEUE_POLL', 5))
+MAILING_QUEUE_VISIBILITY = int(os.getenv('MAILING_QUEUE_VISIBILITY', 600))
+MAILING_RETRY_MAX = int(os.getenv('MAILING_RETRY_MAX', 5))
+MAILING_RETRY_BACKOFF = int(os.getenv('MAILING_RETRY_BACKOFF', 60))
+MAILING_CATCHUP_GRACE = int(os.getenv('MAILING_CATCHUP_GRACE', 120))
+MAILING_CATCHUP_WINDOW = int(os.getenv('MAILING_CATCHUP_WINDOW', 604_800))
+MAILING_CATCHUP_BATCH = int(os.getenv('MAILING_CATCHUP_BATCH', 100))
+MAILING_ATTEMPT_PARTITIONS_AHEAD = int(os.getenv('MAILING_ATTEMPT_PARTITIONS_AHEAD', 3))
+MAILING_ATTEMPT_RETENTION_MONTHS = int(os.getenv('MAILING_ATTEMPT_RETENTION_MONTHS', 12))
+MAILING_ATTEMPT_ARCHIVE_DIR = os.getenv('MAILING_ATTEMPT_ARCHIVE_DIR', BASE_DIR / 'archive')
+
 LOGIN_URL = '/users/login/'
 
 CACHE_ENABLED = os.getenv('CACHE_ENABLED', False) == 'True'
@@ -131,4 +150,54 @@ if CACHE_ENABLED:
         }
     }
 
-logging.basicConfig(level=logging.DEBUG)
+VIEW_CACHE_TIMEOUT = int(os.getenv('VIEW_CACHE_TIMEOUT', 3600))
+VIEW_CACHE_LOCAL_TIMEOUT = int(os.getenv('VIEW_CACHE_LOCAL_TIMEOUT', 10))
+
+BLOG_VIEW_FLUSH_INTERVAL = int(os.getenv('BLOG_VIEW_FLUSH_INTERVAL', 10))
+BLOG_VIEW_FLUSH_SIZE = int(os.getenv('BLOG_VIEW_FLUSH_SIZE', 100))
+
+CLIENT_IMPORT_BATCH_SIZE = int(os.getenv('CLIENT_IMPORT_BATCH_SIZE', 1000))
+CLIENT_IMPORT_REJECTED_SHOWN = int(os.getenv('CLIENT_IMPORT_REJECTED_SHOWN', 100))
+
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+SEGMENT_MATERIALIZE_TTL = int(os.getenv('SEGMENT_MATERIALIZE_TTL', 900))
+
+MESSAGE_TEMPLATE_CACHE_SIZE = int(os.getenv('MESSAGE_TEMPLATE_CACHE_SIZE', 256))
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE')
+METRICS_TEXTFILE_INTERVAL = int(os.getenv('METRICS_TEXTFILE_INTERVAL', 15))
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DUMP_INTERVAL = int(os.getenv('PROFILING_DUMP_INTERVAL', 300))
+PROFILING_DUMP_PATH = os.getenv('PROFILING_DUMP_PATH')
+PROFILING_DUMP_TOP = int(os.getenv('PROFILING_DUMP_TOP', 20))
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        # DEBUG корневого логгера не должен включать журнал каждого SQL-запроса
+        'django.db.backends': {
+            'level': os.getenv('DB_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
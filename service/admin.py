@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from service.models import Client, Message, Mailing, MailingAttempt, Frequency, BlogPost
+from service.models import Client, Message, Mailing, MailingAttempt, Frequency, BlogPost, MailingDelivery, \
+    OutboundEmail, DashboardCounter, MailingDailyStat, Segment, TransactionalEmail
 
 
 @admin.register(Client)
@@ -8,6 +9,11 @@ class ClientAdmin(admin.ModelAdmin):
     list_display = ('id', 'last_name', 'first_name', 'email', 'creator',)
 
 
+@admin.register(Segment)
+class SegmentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'match', 'is_materialized', 'materialized_at', 'creator',)
+
+
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'creator',)
@@ -23,6 +29,32 @@ class MailingAttemptAdmin(admin.ModelAdmin):
     list_display = ('id', 'is_success', 'last_attempt',)
 
 
+@admin.register(MailingDelivery)
+class MailingDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'attempted_at', 'status', 'smtp_code', 'mailing', 'client',)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'mailing', 'status', 'attempts', 'available_at', 'locked_by',)
+
+
+@admin.register(TransactionalEmail)
+class TransactionalEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'recipients', 'status', 'attempts', 'available_at',)
+    exclude = ('body',)
+
+
+@admin.register(DashboardCounter)
+class DashboardCounterAdmin(admin.ModelAdmin):
+    list_display = ('name', 'value',)
+
+
+@admin.register(MailingDailyStat)
+class MailingDailyStatAdmin(admin.ModelAdmin):
+    list_display = ('day', 'mailing', 'owner', 'attempts_success', 'attempts_failed', 'deliveries_sent',)
+
+
 @admin.register(Frequency)
 class FrequencyAdmin(admin.ModelAdmin):
     list_display = ('id', 'name',)
@@ -1,5 +1,3 @@
-from time import sleep
-
 from django.apps import AppConfig
 
 
@@ -8,6 +6,4 @@ class ServiceConfig(AppConfig):
     name = 'service'
 
     def ready(self):
-        from service.services import run_apscheduler
-        sleep(2)
-        run_apscheduler()
+        import service.signals  # noqa: F401
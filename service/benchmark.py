@@ -0,0 +1,141 @@
+import resource
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from service import metrics
+from service.mail import RateLimiter, SMTPConnectionPool
+from service.models import Client, Frequency, Mailing, MailingDelivery, Message, OutboundEmail
+from service.services import enqueue_due_mailings, process_outbound_queue
+from service.smtp_sink import SMTPSink
+from users.models import User
+
+SEED_BATCH = 1000
+
+
+def iter_users(count):
+    first = User.objects.count()
+    for number in range(first, first + count):
+        yield User(email=f'bench-user{number}@example.com', password='!')
+
+
+def iter_clients(users, count):
+    for user in users:
+        for number in range(count):
+            yield Client(email=f'bench-client{user.pk}-{number}@example.com', first_name=f'Клиент {number}',
+                         last_name='Тестов', extra={'city': 'Москва'}, creator=user)
+
+
+def seed(users=10, clients=100, mailings=5, personalised=False):
+    """
+    Заполняет базу по образцу fixtures/: пользователи, их клиенты, сообщения и рассылки,
+    которые наступают прямо сейчас. Каждая рассылка адресована всем клиентам своего владельца.
+    """
+    # рассылки уже наступили к первому тику
+    due_at = timezone.now() - timedelta(seconds=1)
+    frequency = Frequency.objects.create(name='Раз в день', days_until_next_mailing=1)
+    created_users = User.objects.bulk_create(iter_users(users), batch_size=SEED_BATCH)
+    Client.objects.bulk_create(iter_clients(created_users, clients), batch_size=SEED_BATCH)
+
+    body = 'Здравствуйте, {{ first_name }} {{ last_name }} из {{ city }}!' if personalised else 'Тест тело'
+    messages = Message.objects.bulk_create(
+        Message(title='Тест тема', body=body, creator=user) for user in created_users
+    )
+    created_mailings = Mailing.objects.bulk_create(
+        (Mailing(first_sent_at=due_at, next_run_at=due_at, frequency=frequency,
+                 message_to_send=message, creator=message.creator)
+         for message in messages for _ in range(mailings)),
+        batch_size=SEED_BATCH,
+    )
+    client_ids = {}
+    for pk, creator_id in Client.objects.filter(creator__in=created_users).values_list('pk', 'creator_id'):
+        client_ids.setdefault(creator_id, []).append(pk)
+    Through = Mailing.client_list.through
+    Through.objects.bulk_create(
+        (Through(mailing_id=mailing.pk, client_id=client_id)
+         for mailing in created_mailings for client_id in client_ids.get(mailing.creator_id, [])),
+        batch_size=SEED_BATCH,
+    )
+    return len(created_mailings)
+
+
+def measure(function, *args):
+    """Выполняет функцию, возвращает (результат, секунды, число запросов к базе)."""
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - started
+    return result, duration, len(queries)
+
+
+def drain_queue(pool, executor, rate_limiter):
+    processed = 0
+    while batch := process_outbound_queue(pool, executor, rate_limiter):
+        processed += batch
+    return processed
+
+
+def run_benchmark(users=10, clients=100, mailings=5, latency=0.0, failure_rate=0.0, workers=None,
+                  personalised=False, seed_value=None, trace_memory=False):
+    """
+    Сквозной прогон отправки: тик планировщика и разбор очереди через локальный SMTP-сервер.
+
+    Запускать на пустой (тестовой) базе. Возвращает словарь с параметрами и результатами для сохранения в JSON.
+    Пиковая память процесса берется из getrusage; с `trace_memory` дополнительно считается tracemalloc
+    по аллокациям Python во время тика и отправки (заметно замедляет прогон, скорость тогда не сравнима).
+    """
+    workers = workers or settings.MAILING_WORKERS
+    mailing_count = seed(users, clients, mailings, personalised)
+
+    with SMTPSink(latency=latency, failure_rate=failure_rate, seed=seed_value) as sink, override_settings(
+        EMAIL_HOST_USER='bench@example.com', MAILING_RATE_LIMIT=0,
+    ):
+        connection_kwargs = {'backend': 'django.core.mail.backends.smtp.EmailBackend', 'host': sink.host,
+                             'port': sink.port, 'username': '', 'password': '', 'use_tls': False, 'use_ssl': False}
+        metrics.reset()
+        if trace_memory:
+            tracemalloc.start()
+        _, tick_seconds, tick_queries = measure(enqueue_due_mailings)
+        with SMTPConnectionPool(size=workers, **connection_kwargs) as pool, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            outbound, send_seconds, send_queries = measure(drain_queue, pool, executor, RateLimiter())
+            pool_stats = pool.stats
+        peak_traced_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        tracemalloc.stop()
+        smtp_stats = dict(sink.stats)
+
+    return {
+        'parameters': {
+            'users': users, 'clients_per_user': clients, 'mailings_per_user': mailings, 'latency': latency,
+            'failure_rate': failure_rate, 'workers': workers, 'personalised': personalised,
+            'batch_size': settings.MAILING_BATCH_SIZE, 'batch_mode': settings.MAILING_BATCH_MODE,
+            'trace_memory': trace_memory, 'database': connection.vendor,
+        },
+        'results': {
+            'mailings': mailing_count,
+            'tick_seconds': round(tick_seconds, 4),
+            'tick_queries': tick_queries,
+            'outbound_emails': outbound,
+            'outbound_dead': OutboundEmail.objects.filter(status=OutboundEmail.StatusOfOutbound.DEAD).count(),
+            'send_seconds': round(send_seconds, 4),
+            'send_queries': send_queries,
+            'queries_per_mailing': round((tick_queries + send_queries) / max(mailing_count, 1), 2),
+            'smtp_messages': smtp_stats['messages'],
+            'messages_per_second': round(smtp_stats['messages'] / send_seconds, 1) if send_seconds else None,
+            'recipients_per_second': (round(smtp_stats['recipients_accepted'] / send_seconds, 1)
+                                      if send_seconds else None),
+            'deliveries': MailingDelivery.objects.count(),
+            'smtp': smtp_stats,
+            'smtp_pool': pool_stats,
+            'stages': metrics.get_stage_timings(),
+            # ru_maxrss в Linux измеряется в килобайтах
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'peak_traced_memory_bytes': peak_traced_memory,
+        },
+    }
@@ -0,0 +1,37 @@
+import random
+
+from django.db.models import Case, Max, Min, Q, When
+
+from service.models import BlogPost
+
+
+def get_random_blog_posts(count):
+    """
+    Выбирает `count` случайных постов без ORDER BY RANDOM(), который сортирует всю таблицу.
+
+    Случайные id выбираются из диапазона первичных ключей и ищутся по индексу. Чтобы пропуски в id
+    не добавляли запросов, в тот же запрос по индексу добираются `count` постов от случайной точки
+    диапазона и `count` первых постов: всегда два запроса, сортируется не больше 5 * `count` строк.
+    """
+    bounds = BlogPost.objects.aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+    if bounds['min_pk'] is None:
+        return []
+    pk_range = range(bounds['min_pk'], bounds['max_pk'] + 1)
+    candidates = random.sample(pk_range, min(count * 3, len(pk_range)))
+    pivot = random.choice(pk_range)
+    pks = BlogPost.objects.order_by('pk').values('pk')
+    blog_posts = list(
+        BlogPost.objects.select_related('creator').filter(
+            Q(pk__in=candidates) | Q(pk__in=pks.filter(pk__gte=pivot)[:count]) | Q(pk__in=pks[:count])
+        ).order_by(
+            # сначала случайные id, затем посты от случайной точки, затем первые посты
+            Case(When(pk__in=candidates, then=0), When(pk__gte=pivot, then=1), default=2), 'pk'
+        )[:count]
+    )
+    random.shuffle(blog_posts)
+    return blog_posts
+
+
+def get_popular_blog_posts(count):
+    """Самые просматриваемые посты, выбираются по индексу service_blogpost_views_idx без сортировки таблицы."""
+    return BlogPost.objects.order_by('-view_count', '-pk')[:count]
@@ -0,0 +1,83 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches, DEFAULT_CACHE_ALIAS
+from django.core.cache.backends.locmem import LocMemCache
+from django.middleware.csrf import get_token
+
+VERSION_KEY = 'view-cache:version:{}'
+
+# версия прав групп: меняется вместе с правами всех пользователей группы
+AUTH_VERSION_LABEL = 'auth.group'
+
+
+def user_version_label(pk):
+    """Версия пользователя: меняется при изменении его учетной записи, блокировки, групп и прав."""
+    return f'users.user:{pk}'
+
+
+def bump_versions(*model_labels):
+    """Сбрасывает закэшированные страницы, зависящие от моделей, увеличивая их версию."""
+    for model_label in model_labels:
+        key = VERSION_KEY.format(model_label)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def cache_per_user(models, timeout=None):
+    """
+    Кэширует GET-ответ представления отдельно для каждого пользователя.
+
+    В ключ входят пользователь, полный путь запроса и версии моделей `models`, которые увеличиваются
+    сигналами при сохранении и удалении объектов. Поэтому страница одного пользователя не отдается
+    другому, а изменения видны сразу, независимо от срока хранения.
+
+    Кроме версий моделей в ключ входят версии пользователя и прав групп, поэтому заблокированный пользователь
+    или пользователь с отозванными правами не получает страницы из кэша.
+    В локальном кэше процесса (LocMemCache, без CACHE_ENABLED) сигналы других процессов не сбрасывают
+    страницы, поэтому срок хранения там не больше VIEW_CACHE_LOCAL_TIMEOUT.
+
+    Страница содержит CSRF-токен формы выхода, поэтому в ключ входит и CSRF-секрет браузера: токен
+    из кэша всегда выдан для той же куки. Без секрета (первый запрос сессии) страница не кэшируется.
+    """
+    timeout = settings.VIEW_CACHE_TIMEOUT if timeout is None else timeout
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            csrf_secret = request.META.get('CSRF_COOKIE')
+            if request.method != 'GET' or not request.user.is_authenticated or not csrf_secret:
+                return view(request, *args, **kwargs)
+
+            labels = [*models, user_version_label(request.user.pk), AUTH_VERSION_LABEL]
+            version_keys = [VERSION_KEY.format(label) for label in labels]
+            versions = cache.get_many(version_keys)
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            browser = hashlib.md5(csrf_secret.encode()).hexdigest()
+            key = 'view-cache:{}:{}:{}:{}'.format(
+                request.user.pk, browser, path,
+                '.'.join(str(versions.get(version_key, 0)) for version_key in version_keys),
+            )
+            response = cache.get(key)
+            if response is not None:
+                # как при отрисовке шаблона: CSRF-кука ответа продлевается
+                get_token(request)
+                return response
+
+            response = view(request, *args, **kwargs)
+            page_timeout = timeout
+            if isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+                page_timeout = min(timeout, settings.VIEW_CACHE_LOCAL_TIMEOUT)
+            if response.status_code == 200 and not response.streaming:
+                if hasattr(response, 'render') and callable(response.render):
+                    response.add_post_render_callback(lambda rendered: cache.set(key, rendered, page_timeout))
+                else:
+                    cache.set(key, response, page_timeout)
+            return response
+
+        return wrapper
+
+    return decorator
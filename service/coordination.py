@@ -0,0 +1,85 @@
+import logging
+import os
+import socket
+from datetime import timedelta
+from math import ceil
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from service.models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# идентификатор узла планировщика, которым подписываются аренды
+NODE_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+LEADER_LEASE = 'leader'
+NODE_LEASE_PREFIX = 'node:'
+
+
+def _lease_expires_at(now):
+    return now + timedelta(seconds=settings.MAILING_SHARD_LEASE)
+
+
+def claim_leadership(now=None):
+    """
+    Захватывает или продлевает аренду ведущего узла одним атомарным UPDATE.
+
+    Ведущий выполняет задачи, которые должны идти в одном экземпляре на весь кластер.
+    Если ведущий упал, его аренда истекает и ее забирает следующий узел.
+    """
+    now = now or timezone.now()
+    SchedulerLease.objects.get_or_create(name=LEADER_LEASE)
+    claimed = SchedulerLease.objects.filter(
+        Q(owner=NODE_ID) | Q(expires_at__isnull=True) | Q(expires_at__lte=now),
+        name=LEADER_LEASE,
+    ).update(owner=NODE_ID, expires_at=_lease_expires_at(now))
+    return bool(claimed)
+
+
+def claim_shards(now=None, node_id=NODE_ID):
+    """
+    Продлевает аренду своих шардов и забирает свободные до справедливой доли.
+
+    Каждый узел при вызове продлевает свою аренду-пульс `node:<узел>`, и доля считается по живым пульсам,
+    а не по владельцам шардов: поэтому новый узел, еще не получивший ни одного шарда, сразу учитывается,
+    старые узлы на своем следующем вызове отдают лишние шарды, а новый забирает их на своем.
+    Шарды упавшего узла освобождаются, когда истекает его аренда (MAILING_SHARD_LEASE).
+    Возвращает номера шардов, которыми узел владеет до следующего вызова.
+    """
+    now = now or timezone.now()
+    total = settings.MAILING_SHARDS
+    names = [f'shard:{number}' for number in range(total)]
+    SchedulerLease.objects.bulk_create([SchedulerLease(name=name) for name in names], ignore_conflicts=True)
+    SchedulerLease.objects.update_or_create(name=f'{NODE_LEASE_PREFIX}{node_id}',
+                                            defaults={'owner': node_id, 'expires_at': _lease_expires_at(now)})
+    # пульсы упавших узлов больше не нужны: после перезапуска у узла новый идентификатор
+    SchedulerLease.objects.filter(name__startswith=NODE_LEASE_PREFIX, expires_at__lte=now).delete()
+
+    with transaction.atomic():
+        leases = list(SchedulerLease.objects.select_for_update().filter(name__in=names).order_by('name'))
+        nodes = set(SchedulerLease.objects.filter(
+            name__startswith=NODE_LEASE_PREFIX, expires_at__gt=now,
+        ).values_list('owner', flat=True)) | {node_id}
+
+        def is_alive(lease):
+            return lease.owner is not None and lease.expires_at is not None and lease.expires_at > now
+
+        fair_share = ceil(total / len(nodes))
+        mine = [lease for lease in leases if is_alive(lease) and lease.owner == node_id]
+        free = [lease for lease in leases if not is_alive(lease)]
+
+        released = mine[fair_share:]
+        mine = mine[:fair_share] + free[:max(fair_share - len(mine), 0)]
+        for lease in mine:
+            lease.owner, lease.expires_at = node_id, _lease_expires_at(now)
+        for lease in released:
+            lease.owner, lease.expires_at = None, None
+        SchedulerLease.objects.bulk_update(mine + released, ['owner', 'expires_at'])
+
+    shards = sorted(int(lease.name.split(':')[1]) for lease in mine)
+    logger.info('Node %s owns shards %s of %s among %s nodes', node_id, shards, total, len(nodes))
+    return shards
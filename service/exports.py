@@ -0,0 +1,86 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from service.models import Client, Mailing, MailingAttempt
+
+FORMATS = ('csv', 'jsonl')
+
+# выгружаемые данные: модель, столбцы, поле владельца и поле даты для фильтров
+EXPORTS = {
+    'clients': {
+        'model': Client,
+        'fields': ['id', 'email', 'last_name', 'first_name', 'middle_name', 'comment', 'creator__email'],
+        'owner_field': 'creator',
+        'date_field': None,
+    },
+    'mailings': {
+        'model': Mailing,
+        'fields': ['id', 'status', 'first_sent_at', 'next_run_at', 'frequency__name', 'message_to_send__title',
+                   'creator__email'],
+        'owner_field': 'creator',
+        'date_field': 'first_sent_at',
+    },
+    'attempts': {
+        'model': MailingAttempt,
+        'fields': ['id', 'last_attempt', 'is_success', 'server_answer', 'mailing_id'],
+        'owner_field': 'mailing__creator',
+        'date_field': 'last_attempt',
+    },
+}
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def get_export_rows(name, owner=None, date_from=None, date_to=None, chunk_size=None):
+    """
+    Строки выгрузки в порядке pk, читаемые с сервера пачками по `chunk_size` (серверный курсор в PostgreSQL).
+
+    Фильтр по датам включает обе границы и применяется к выгрузкам, у которых есть поле даты;
+    для попыток он к тому же ограничивает чтение нужными месячными секциями.
+    """
+    export = EXPORTS[name]
+    queryset = export['model'].objects.all()
+    if owner is not None:
+        queryset = queryset.filter(**{export['owner_field']: owner})
+    if export['date_field'] and date_from:
+        queryset = queryset.filter(**{f"{export['date_field']}__gte": _start_of_day(date_from)})
+    if export['date_field'] and date_to:
+        queryset = queryset.filter(**{f"{export['date_field']}__lt": _start_of_day(date_to + timedelta(days=1))})
+    rows = queryset.order_by('pk').values_list(*export['fields'])
+    return rows.iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку вместо буферизации."""
+
+    def write(self, value):
+        return value
+
+
+def iter_export(name, rows, file_format, chunk_size=None):
+    """Отдает выгрузку кусками текста по `chunk_size` строк, начиная с заголовка."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    fields = EXPORTS[name]['fields']
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        render = writer.writerow
+    else:
+        def render(row):
+            return json.dumps(dict(zip(fields, row)), ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+    chunk = []
+    for row in rows:
+        chunk.append(render(row))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -1,6 +1,7 @@
 from django import forms
 
-from service.models import Message, Client, Mailing, BlogPost
+from service.models import Message, Client, Mailing, BlogPost, Segment
+from service.segments import validate_rules
 
 
 class StyleFormMixin:
@@ -14,12 +15,54 @@ class MessageForm(StyleFormMixin, forms.ModelForm):
     class Meta:
         model = Message
         fields = ('title', 'body',)
+        help_texts = {
+            'body': 'Можно использовать подстановки {{ first_name }}, {{ last_name }}, {{ middle_name }}, {{ email }} '
+                    'и имена дополнительных полей клиента, например {{ city }}.',
+        }
 
 
 class ClientForm(StyleFormMixin, forms.ModelForm):
     class Meta:
         model = Client
-        fields = ('email', 'last_name', 'first_name', 'middle_name', 'comment',)
+        fields = ('email', 'last_name', 'first_name', 'middle_name', 'comment', 'extra',)
+
+
+class SegmentForm(StyleFormMixin, forms.ModelForm):
+    class Meta:
+        model = Segment
+        fields = ('name', 'rules', 'match', 'is_materialized',)
+        help_texts = {
+            'rules': 'Список условий, например: [{"field": "first_name", "op": "contains", "value": "Иван"}, '
+                     '{"field": "received_within_days", "value": 30}]. Поля клиента: email, last_name, '
+                     'first_name, middle_name, comment; операции: equals, contains, startswith, endswith, empty, '
+                     'not_empty. История отправок: received_within_days, not_received_within_days, '
+                     'refused_within_days (число дней), received_mailing, not_received_mailing (id рассылки).',
+            'is_materialized': 'Состав сохраняется в базе и периодически пересчитывается - для больших сегментов.',
+        }
+
+    def clean_rules(self):
+        rules = self.cleaned_data['rules']
+        validate_rules(rules)
+        return rules
+
+    def save(self, commit=True):
+        # после изменения условий сохраненный состав устарел и будет пересчитан при следующей отправке
+        if {'rules', 'match', 'is_materialized'} & set(self.changed_data):
+            self.instance.materialized_at = None
+        return super().save(commit)
+
+
+class ClientImportForm(StyleFormMixin, forms.Form):
+    file = forms.FileField(label='Файл CSV или JSONL')
+    file_format = forms.ChoiceField(label='Формат', required=False,
+                                    choices=[('', 'По расширению файла'), ('csv', 'CSV'), ('jsonl', 'JSONL')])
+
+
+class ExportFilterForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSONL')], required=False)
+    owner = forms.EmailField(required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
 
 
 class MailingForm(StyleFormMixin, forms.ModelForm):
@@ -27,7 +70,7 @@ class MailingForm(StyleFormMixin, forms.ModelForm):
 
     class Meta:
         model = Mailing
-        fields = ('first_sent_at', 'frequency', 'status', 'client_list', 'message_to_send',)
+        fields = ('first_sent_at', 'frequency', 'status', 'segment', 'client_list', 'message_to_send',)
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop("request")
@@ -35,6 +78,19 @@ class MailingForm(StyleFormMixin, forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields["client_list"].queryset = Client.objects.filter(creator=user)
         self.fields["message_to_send"].queryset = Message.objects.filter(creator=user)
+        self.fields["segment"].queryset = Segment.objects.filter(creator=user)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('segment') and not cleaned_data.get('client_list'):
+            raise forms.ValidationError('Выберите сегмент или клиентов')
+        return cleaned_data
+
+    def save(self, commit=True):
+        # при изменении расписания следующая отправка пересчитывается в Mailing.save()
+        if {'first_sent_at', 'frequency', 'status'} & set(self.changed_data):
+            self.instance.next_run_at = None
+        return super().save(commit)
 
 
 class MailingModeratorForm(StyleFormMixin, forms.ModelForm):
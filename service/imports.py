@@ -0,0 +1,165 @@
+import csv
+import json
+import logging
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from service.cache import bump_versions
+from service.models import Client, DashboardCounter
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FIELDS = ('email', 'last_name', 'first_name', 'middle_name', 'comment')
+UPDATE_FIELDS = [*(field for field in IMPORT_FIELDS if field != 'email'), 'extra']
+FORMATS = ('csv', 'jsonl')
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def iter_rows(lines, file_format):
+    """
+    Построчно читает CSV (с заголовком) или JSONL и выдает (номер строки, словарь полей или None).
+
+    Файл не загружается в память целиком; None означает строку, которую не удалось разобрать.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def clean_row(row):
+    """
+    Проверяет поля строки валидаторами модели Client, возвращает (данные, ошибки).
+
+    Остальные непустые столбцы сохраняются в Client.extra и доступны в подстановках сообщений.
+    """
+    if row is None:
+        return None, ['строка не разобрана']
+    data, errors = {}, []
+    for name in IMPORT_FIELDS:
+        field = Client._meta.get_field(name)
+        value = str(row.get(name) or '').strip()
+        if not value and field.null:
+            value = None
+        try:
+            data[name] = field.clean(value, None)
+        except ValidationError as e:
+            errors.extend(f'{name}: {message}' for message in e.messages)
+    data['extra'] = {key: value for key, value in row.items()
+                     if key and key not in IMPORT_FIELDS and value not in (None, '')}
+    return data, errors
+
+
+def insert_returning_emails(clients, on_conflict, on_conflict_params=()):
+    """
+    Вставляет клиентов запросами INSERT ... {on_conflict} RETURNING email, возвращает затронутые адреса.
+
+    bulk_create не сообщает, какие строки вставлены или обновлены, поэтому запрос собирается здесь;
+    значения готовятся полями модели, как в bulk_create.
+    """
+    quote_name = connection.ops.quote_name
+    fields = [field for field in Client._meta.concrete_fields if not field.primary_key]
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    placeholders = '({})'.format(', '.join(['%s'] * len(fields)))
+    batch_size = connection.ops.bulk_batch_size(fields, clients) or len(clients)
+    emails = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(clients), batch_size):
+            batch = clients[start:start + batch_size]
+            params = [field.get_db_prep_save(field.pre_save(client, True), connection)
+                      for client in batch for field in fields]
+            cursor.execute(
+                f'INSERT INTO {quote_name(Client._meta.db_table)} ({columns}) '
+                f'VALUES {", ".join([placeholders] * len(batch))} {on_conflict} RETURNING {quote_name("email")}',
+                [*params, *on_conflict_params],
+            )
+            emails.update(email for email, in cursor.fetchall())
+    return emails
+
+
+def upsert_clients(rows, creator):
+    """
+    Сохраняет пачку клиентов: новые адреса вставляются, адреса пользователя обновляются.
+
+    Принадлежность адреса проверяется в самом запросе (ON CONFLICT ... DO UPDATE ... WHERE creator_id),
+    а не предварительным чтением: адрес, добавленный другим пользователем во время импорта, не перезаписывается.
+    Возвращает (создано, обновлено, чужие адреса).
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(Client._meta.db_table)
+    clients = [Client(creator=creator, **data) for data in rows.values()]
+    with transaction.atomic():
+        created = insert_returning_emails(clients, f'ON CONFLICT ({quote_name("email")}) DO NOTHING')
+        existing = [client for client in clients if client.email not in created]
+        updated = set()
+        if existing:
+            assignments = ', '.join(
+                f'{quote_name(column)} = EXCLUDED.{quote_name(column)}'
+                for column in (Client._meta.get_field(name).column for name in UPDATE_FIELDS)
+            )
+            updated = insert_returning_emails(
+                existing,
+                f'ON CONFLICT ({quote_name("email")}) DO UPDATE SET {assignments} '
+                f'WHERE {table}.{quote_name(Client._meta.get_field("creator").column)} = %s',
+                [creator.pk],
+            )
+        # запрос в обход ORM не отправляет post_save, поэтому счетчик главной страницы обновляется здесь
+        if created:
+            DashboardCounter.increment(DashboardCounter.CLIENTS, len(created))
+    return len(created), len(updated), set(rows) - created - updated
+
+
+def import_clients(lines, file_format, creator, batch_size=None, on_batch=None, on_reject=None):
+    """
+    Импортирует клиентов из потока строк файла пачками по `batch_size`.
+
+    В памяти держится только текущая пачка. `on_batch(stats)` вызывается после каждой пачки,
+    `on_reject(номер строки, ошибки)` - для каждой отклоненной строки.
+    Повтор адреса внутри файла обновляет клиента последним значением.
+    """
+    batch_size = batch_size or settings.CLIENT_IMPORT_BATCH_SIZE
+    stats = {'processed': 0, 'created': 0, 'updated': 0, 'rejected': 0}
+
+    def reject(number, errors):
+        stats['rejected'] += 1
+        if on_reject:
+            on_reject(number, errors)
+
+    rows = iter_rows(lines, file_format)
+    while batch := list(islice(rows, batch_size)):
+        valid, line_numbers = {}, {}
+        for number, row in batch:
+            data, errors = clean_row(row)
+            if errors:
+                reject(number, errors)
+            else:
+                valid[data['email']] = data
+                line_numbers[data['email']] = number
+        if valid:
+            created, updated, foreign = upsert_clients(valid, creator)
+            stats['created'] += created
+            stats['updated'] += updated
+            for email in foreign:
+                reject(line_numbers[email], [f'email: адрес {email} принадлежит другому пользователю'])
+        stats['processed'] += len(batch)
+        if on_batch:
+            on_batch(stats)
+
+    bump_versions(Client._meta.label_lower)
+    logger.info('Imported clients for %s: %s', creator, stats)
+    return stats
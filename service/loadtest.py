@@ -0,0 +1,158 @@
+import math
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern
+from django.utils import timezone
+
+from service import urls as service_urls
+from service.benchmark import seed
+from service.models import BlogPost, Client, Mailing, MailingAttempt, MailingDailyStat, Message, Segment
+from users import urls as users_urls
+from users.models import User
+
+SESSION_PERMISSIONS = ('can_view_all_users', 'can_edit_is_banned')
+
+# модель, объект которой подставляется в <int:pk>, по первому сегменту адреса
+PK_MODELS = {
+    'attempts': (MailingAttempt, 'mailing__creator'),
+    'messages': (Message, 'creator'),
+    'clients': (Client, 'creator'),
+    'segments': (Segment, 'creator'),
+    'mailings': (Mailing, 'creator'),
+    'blog': (BlogPost, 'creator'),
+    'update': (User, 'pk'),
+}
+STR_PARAMETERS = {'name': 'clients'}
+
+
+def seed_site(users=5, clients=200, mailings=5, attempts=20, posts=5, days=30):
+    """Данные для страниц: то же, что для замера отправки, плюс попытки, посты, сегменты и статистика."""
+    seed(users, clients, mailings)
+    sessions = list(User.objects.filter(email__startswith='bench-user').order_by('pk'))
+    permissions = list(Permission.objects.filter(codename__in=SESSION_PERMISSIONS))
+    for user in sessions:
+        user.user_permissions.add(*permissions)
+
+    user_mailings = list(Mailing.objects.filter(creator__in=sessions))
+    MailingAttempt.objects.bulk_create(
+        (MailingAttempt(is_success=number % 10 != 0, server_answer='250 OK', mailing=mailing)
+         for mailing in user_mailings for number in range(attempts)),
+        batch_size=1000,
+    )
+    today = timezone.localdate()
+    MailingDailyStat.objects.bulk_create(
+        (MailingDailyStat(mailing=mailing, owner_id=mailing.creator_id, day=today - timedelta(days=day),
+                          attempts_success=9, attempts_failed=1, deliveries_sent=clients)
+         for mailing in user_mailings for day in range(days)),
+        batch_size=1000,
+    )
+    BlogPost.objects.bulk_create(
+        BlogPost(title=f'Пост {number}', body='Текст поста', creator=user)
+        for user in sessions for number in range(posts)
+    )
+    Segment.objects.bulk_create(
+        Segment(name='Клиенты', rules=[{'field': 'first_name', 'op': 'startswith', 'value': 'Клиент'}], creator=user)
+        for user in sessions
+    )
+    return sessions
+
+
+def iter_routes():
+    """Маршруты service/urls.py и users/urls.py, которые можно открыть GET-запросом."""
+    for prefix, module in (('/', service_urls), ('/users/', users_urls)):
+        for pattern in module.urlpatterns:
+            if isinstance(pattern, URLPattern):
+                yield prefix + str(pattern.pattern)
+
+
+def build_url(route, user):
+    """Подставляет в маршрут объект пользователя сессии; None, если подставить нечего."""
+    parts = []
+    for part in route.strip('/').split('/'):
+        if part == '<int:pk>':
+            model, owner_field = PK_MODELS[parts[0] if parts[0] != 'users' else parts[1]]
+            pk = model.objects.filter(**{owner_field: user.pk}).order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            part = str(pk)
+        elif part.startswith('<str:'):
+            value = STR_PARAMETERS.get(part[5:-1])
+            if value is None:
+                return None
+            part = value
+        parts.append(part)
+    return '/' + '/'.join(part for part in parts if part) + ('/' if parts and parts[-1] else '')
+
+
+def percentile(values, share):
+    """Процентиль по ближайшему рангу."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def run_session(client, url, count):
+    """Выполняет `count` запросов одной сессии, возвращает [(секунды, запросы к базе, статус)]."""
+    samples = []
+    try:
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                duration = time.perf_counter() - started
+            samples.append((duration, len(queries), response.status_code))
+    finally:
+        connection.close()
+    return samples
+
+
+def run_load(sessions, requests=50, concurrency=4, warmup=1):
+    """
+    Нагружает каждый маршрут по очереди: `concurrency` авторизованных сессий параллельно делают
+    в сумме `requests` GET-запросов. Первые `warmup` запросов каждой сессии (заполнение кэша) не учитываются.
+    """
+    clients = []
+    for user in sessions[:concurrency]:
+        # ошибки страниц попадают в статусы отчета, а не прерывают прогон
+        client = TestClient(raise_request_exception=False)
+        client.force_login(user)
+        clients.append((client, user))
+    per_session = max(requests // len(clients), 1)
+
+    report = {}
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        for route in iter_routes():
+            urls = [build_url(route, user) for _, user in clients]
+            if None in urls:
+                report[route] = {'skipped': 'no object to open'}
+                continue
+            for (client, _), url in zip(clients, urls):
+                run_session(client, url, warmup)
+            started = time.perf_counter()
+            results = list(executor.map(run_session, [client for client, _ in clients], urls,
+                                        [per_session] * len(clients)))
+            wall_time = time.perf_counter() - started
+            samples = [sample for session in results for sample in session]
+            durations = [duration * 1000 for duration, _, _ in samples]
+            queries = [count for _, count, _ in samples]
+            report[route] = {
+                'requests': len(samples),
+                'statuses': dict(Counter(str(status) for _, _, status in samples)),
+                'p50_ms': round(percentile(durations, 0.50), 2),
+                'p95_ms': round(percentile(durations, 0.95), 2),
+                'p99_ms': round(percentile(durations, 0.99), 2),
+                'queries_per_request': round(sum(queries) / len(queries), 2),
+                'max_queries': max(queries),
+                'requests_per_second': round(len(samples) / wall_time, 1),
+            }
+    return report
@@ -0,0 +1,167 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.message import sanitize_address
+
+from service import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PartialDeliveryError(smtplib.SMTPException):
+    """Отправка пачки прервалась после того, как сервер принял первые `sent` писем."""
+
+    def __init__(self, error, sent, refused):
+        super().__init__(str(error))
+        self.error = error
+        self.sent = sent
+        self.refused = refused
+        self.smtp_code = getattr(error, 'smtp_code', None)
+
+
+class SMTPConnectionPool:
+    """
+    Ограниченный пул авторизованных SMTP-соединений.
+
+    Соединение открывается (TLS и логин) один раз и переиспользуется для всех писем тика,
+    вместо нового соединения на каждый вызов send_mail. Если сервер разорвал соединение,
+    оно переоткрывается и отправка повторяется один раз.
+    """
+
+    def __init__(self, size=None, **connection_kwargs):
+        self.size = size or settings.MAILING_SMTP_POOL_SIZE
+        self._connection_kwargs = connection_kwargs
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._connections = []
+        self.reconnects = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def stats(self):
+        return {
+            'size': self.size,
+            'open': len(self._connections),
+            'reconnects': self.reconnects,
+        }
+
+    def _open(self):
+        connection = get_connection(fail_silently=False, **self._connection_kwargs)
+        with metrics.span('smtp_connect', reason='open'):
+            connection.open()
+        metrics.increment('smtp_connections_total', reason='open')
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    def _reconnect(self, connection):
+        try:
+            connection.close()
+        except (smtplib.SMTPException, OSError):
+            # сервер уже закрыл соединение, достаточно сбросить его на нашей стороне
+            connection.connection = None
+        with metrics.span('smtp_connect', reason='reconnect'):
+            connection.open()
+        metrics.increment('smtp_connections_total', reason='reconnect')
+        with self._lock:
+            self.reconnects += 1
+        logger.info('SMTP connection reopened, reconnects: %s', self.reconnects)
+
+    @contextmanager
+    def connection(self):
+        """Выдает соединение из пула, при необходимости открывая новое (не больше `size`)."""
+        self._slots.acquire()
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._open()
+            try:
+                yield connection
+            finally:
+                self._idle.put(connection)
+        finally:
+            self._slots.release()
+
+    def send_messages(self, messages):
+        self.deliver(messages)
+        return sum(1 for message in messages if message.recipients())
+
+    def deliver(self, messages):
+        """
+        Отправляет письма и возвращает адреса, отклоненные сервером: {адрес: (код, ответ)}.
+
+        В отличие от send_messages, ответ sendmail по отдельным получателям не теряется.
+        После разрыва соединения повторяются только письма, которые сервер еще не принял.
+        Если отправка прервалась после части писем, выбрасывается PartialDeliveryError с числом
+        принятых писем, чтобы повторно отправлялся только остаток и получатели не получали дублей.
+        """
+        progress = {'sent': 0, 'refused': {}}
+        with self.connection() as connection:
+            try:
+                try:
+                    self._deliver(connection, messages, progress)
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    self._reconnect(connection)
+                    self._deliver(connection, messages, progress)
+            except (smtplib.SMTPException, OSError) as e:
+                if not progress['sent']:
+                    raise
+                raise PartialDeliveryError(e, progress['sent'], progress['refused']) from e
+        return progress['refused']
+
+    @staticmethod
+    def _deliver(connection, messages, progress):
+        connection.open()
+        for message in messages[progress['sent']:]:
+            if message.recipients():
+                encoding = message.encoding or settings.DEFAULT_CHARSET
+                from_email = sanitize_address(message.from_email, encoding)
+                recipients = [sanitize_address(address, encoding) for address in message.recipients()]
+                try:
+                    progress['refused'].update(connection.connection.sendmail(
+                        from_email, recipients, message.message().as_bytes(linesep='\r\n')
+                    ))
+                except smtplib.SMTPRecipientsRefused as e:
+                    progress['refused'].update(e.recipients)
+            progress['sent'] += 1
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except (smtplib.SMTPException, OSError):
+                logger.exception('Failed to close SMTP connection')
+        self._idle = queue.LifoQueue()
+
+
+class RateLimiter:
+    """Общее для всех потоков ограничение: не больше `rate` отправок в секунду (0 - без ограничения)."""
+
+    def __init__(self, rate=None):
+        self.rate = settings.MAILING_RATE_LIMIT if rate is None else rate
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self, count=1):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + count / self.rate
+        time.sleep(slot - now)
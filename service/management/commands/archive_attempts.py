@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from service.partitions import archive_old_attempts, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = "Creates upcoming MailingAttempt partitions and archives attempts older than the retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-months', type=int, default=None,
+                            help='Keep attempts of this many recent months (MAILING_ATTEMPT_RETENTION_MONTHS).')
+        parser.add_argument('--archive-dir', default=None,
+                            help='Directory for compressed archives (MAILING_ATTEMPT_ARCHIVE_DIR).')
+
+    def handle(self, *args, **options):
+        for name in ensure_partitions():
+            self.stdout.write(f'Created partition {name}')
+        for path in archive_old_attempts(retention_months=options['retention_months'],
+                                         archive_dir=options['archive_dir']):
+            self.stdout.write(f'Archived to {path}')
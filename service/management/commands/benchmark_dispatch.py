@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from service.benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = "Seeds a throwaway test database and measures mailing dispatch against a local SMTP sink."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--clients', type=int, default=100, help='Clients per user.')
+        parser.add_argument('--mailings', type=int, default=5, help='Mailings per user.')
+        parser.add_argument('--latency', type=float, default=0.0, help='SMTP sink delay per message, seconds.')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of recipients refused with 550.')
+        parser.add_argument('--workers', type=int, default=None, help='Dispatch threads (MAILING_WORKERS).')
+        parser.add_argument('--personalised', action='store_true', help='Use messages with placeholders.')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Measure Python allocations with tracemalloc (slows the run down).')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for refused recipients.')
+        parser.add_argument('--output', default=None, help='Write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        # прогон идет в отдельной тестовой базе, рабочие данные не затрагиваются
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = run_benchmark(users=options['users'], clients=options['clients'], mailings=options['mailings'],
+                                   latency=options['latency'], failure_rate=options['failure_rate'],
+                                   workers=options['workers'], personalised=options['personalised'],
+                                   seed_value=options['seed'], trace_memory=options['trace_memory'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        report['started_at'] = timezone.now().isoformat()
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
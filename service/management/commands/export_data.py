@@ -0,0 +1,45 @@
+import argparse
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from service.exports import EXPORTS, FORMATS, get_export_rows, iter_export
+from users.models import User
+
+
+def date_argument(value):
+    day = parse_date(value)
+    if day is None:
+        raise argparse.ArgumentTypeError(f'{value} is not a YYYY-MM-DD date')
+    return day
+
+
+class Command(BaseCommand):
+    help = "Streams clients, mailings or mailing attempts to CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--owner', default=None, help='Export only data of the user with this email.')
+        parser.add_argument('--date-from', type=date_argument, default=None, help='YYYY-MM-DD, inclusive.')
+        parser.add_argument('--date-to', type=date_argument, default=None, help='YYYY-MM-DD, inclusive.')
+        parser.add_argument('--output', default=None, help='Output file, stdout by default.')
+
+    def handle(self, *args, **options):
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(email=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['owner']} does not exist")
+
+        rows = get_export_rows(options['name'], owner=owner, date_from=options['date_from'],
+                               date_to=options['date_to'])
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in iter_export(options['name'], rows, options['format']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
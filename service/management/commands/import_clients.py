@@ -0,0 +1,40 @@
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+
+from service.imports import FORMATS, guess_format, import_clients
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Imports clients from a CSV (with header) or JSONL file, updating existing ones by email."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file; columns: email, last_name, first_name, '
+                                         'middle_name, comment.')
+        parser.add_argument('--owner', required=True, help='Email of the user the clients belong to.')
+        parser.add_argument('--format', choices=FORMATS, default=None,
+                            help='File format, guessed from the extension by default.')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per INSERT (CLIENT_IMPORT_BATCH_SIZE).')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(email=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['owner']} does not exist")
+        file_format = options['format'] or guess_format(options['path'])
+
+        def report_progress(stats):
+            self.stdout.write(f"Processed {stats['processed']}: created {stats['created']}, "
+                              f"updated {stats['updated']}, rejected {stats['rejected']}")
+
+        def report_rejected(number, errors):
+            self.stderr.write(f"Line {number}: {'; '.join(errors)}")
+
+        with io.open(options['path'], encoding='utf-8-sig', newline='') as file:
+            stats = import_clients(file, file_format, owner, batch_size=options['batch_size'],
+                                   on_batch=report_progress, on_reject=report_rejected)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: created {stats['created']}, updated {stats['updated']}, rejected {stats['rejected']}"
+        ))
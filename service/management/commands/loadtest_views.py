@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from service.loadtest import run_load, seed_site
+
+
+class Command(BaseCommand):
+    help = ("Seeds a throwaway test database and load-tests every GET route of service/urls.py and users/urls.py "
+            "with concurrent authenticated sessions, using the local memory cache.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Seeded users; each session logs in as one.')
+        parser.add_argument('--clients', type=int, default=200, help='Clients per user.')
+        parser.add_argument('--mailings', type=int, default=5, help='Mailings per user.')
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per route.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Parallel sessions (at most --users).')
+        parser.add_argument('--warmup', type=int, default=1, help='Unmeasured requests per session and route.')
+        parser.add_argument('--output', default=None, help='Write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                ALLOWED_HOSTS=['testserver'],
+                DEBUG=False,
+            ):
+                sessions = seed_site(options['users'], options['clients'], options['mailings'])
+                routes = run_load(sessions, options['requests'], options['concurrency'], options['warmup'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'parameters': {key: options[key] for key in ('users', 'clients', 'mailings', 'requests',
+                                                         'concurrency', 'warmup')},
+            'database': connection.vendor,
+            'routes': routes,
+        }
+        for route, result in routes.items():
+            if 'skipped' in result:
+                self.stdout.write(f"{route:<32} skipped: {result['skipped']}")
+                continue
+            self.stdout.write(f"{route:<32} p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+                              f"p99 {result['p99_ms']:>8} ms  {result['queries_per_request']:>6} q/req  "
+                              f"{result['requests_per_second']:>8} req/s  {result['statuses']}")
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
@@ -1,14 +1,36 @@
 import logging
+import threading
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from service.services import run_apscheduler
+from service import metrics
+from service.services import run_apscheduler, run_queue_worker
 
 logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = "Runs APScheduler."
+    help = "Runs APScheduler and/or the outbound email queue worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['all', 'scheduler', 'worker'], default='all',
+                            help='Run the scheduler, the queue worker, or both in one process.')
+        parser.add_argument('--metrics-port', type=int, default=settings.METRICS_PORT,
+                            help='Serve Prometheus metrics on this port (0 disables the endpoint).')
+        parser.add_argument('--metrics-textfile', default=settings.METRICS_TEXTFILE,
+                            help='Periodically write Prometheus metrics to this file for the textfile collector.')
 
     def handle(self, *args, **options):
+        if options['metrics_port']:
+            metrics.start_http_server(options['metrics_port'])
+        if options['metrics_textfile']:
+            threading.Thread(target=metrics.run_textfile_exporter, name='metrics-textfile', daemon=True,
+                             args=(options['metrics_textfile'], settings.METRICS_TEXTFILE_INTERVAL)).start()
+
+        if options['mode'] == 'worker':
+            run_queue_worker()
+            return
+        if options['mode'] == 'all':
+            threading.Thread(target=run_queue_worker, name='outbound-queue-worker', daemon=True).start()
         run_apscheduler()
@@ -0,0 +1,212 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# счетчики и гистограммы процесса планировщика и обработчика очереди
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_histograms = {}
+
+# границы корзин гистограмм длительности, в секундах
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_METRIC = 'mailing_stage_duration_seconds'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HELP = {
+    'mailing_misfires_total': 'Missed mailing occurrences caught up by the scheduler.',
+    'mailing_misfires_skipped_total': 'Missed mailing occurrences skipped as too old.',
+    'mailing_ticks_total': 'Scheduler ticks by result.',
+    'mailing_last_tick_timestamp_seconds': 'Unix time of the last successful scheduler tick.',
+    'mailings_due_total': 'Due mailings claimed by the scheduler.',
+    'mailing_occurrences_enqueued_total': 'Mailing occurrences put into the outbound queue.',
+    'outbound_emails_total': 'Outbound queue emails processed, by result.',
+    'mailing_recipients_total': 'Recipients of processed outbound emails, by delivery status.',
+    'smtp_connections_total': 'SMTP connections opened, by reason.',
+    STAGE_METRIC: 'Duration of dispatcher stages.',
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    """Добавляет наблюдение в гистограмму `name`."""
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        if histogram is None:
+            histogram = _histograms[_key(name, labels)] = {
+                'buckets': [0] * len(DURATION_BUCKETS), 'sum': 0.0, 'count': 0,
+            }
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                histogram['buckets'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+@contextmanager
+def span(stage, **fields):
+    """
+    Замеряет длительность этапа тика или обработки очереди.
+
+    Длительность попадает в гистограмму mailing_stage_duration_seconds{stage=...}, а в журнал пишется
+    строка вида `span stage=send status=ok duration=0.120 emails=3` (уровень DEBUG) для разбора отдельных тиков.
+    В `fields` можно дописать значения, известные только после завершения этапа.
+    """
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield fields
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        observe(STAGE_METRIC, duration, stage=stage)
+        if logger.isEnabledFor(logging.DEBUG):
+            extra = ''.join(f' {name}={value}' for name, value in fields.items())
+            logger.debug('span stage=%s status=%s duration=%.3f%s', stage, status, duration, extra)
+
+
+def get_counters():
+    """Значения счетчиков без меток: {имя: значение}, метки суммируются."""
+    with _lock:
+        counters = defaultdict(int)
+        for (name, _labels), value in _counters.items():
+            counters[name] += value
+        return dict(counters)
+
+
+def get_stage_timings():
+    """Сводка по этапам: {этап: {'count': число замеров, 'seconds': суммарная длительность}}."""
+    with _lock:
+        return {
+            dict(labels)['stage']: {'count': histogram['count'], 'seconds': round(histogram['sum'], 4)}
+            for (name, labels), histogram in _histograms.items() if name == STAGE_METRIC
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Текстовый формат Prometheus (exposition format 0.0.4) для всех метрик процесса."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((key, dict(value, buckets=list(value['buckets']))) for key, value in _histograms.items())
+
+    lines = []
+    described = set()
+
+    def describe(name, metric_type):
+        if name in described:
+            return
+        described.add(name)
+        if name in HELP:
+            lines.append(f'# HELP {name} {HELP[name]}')
+        lines.append(f'# TYPE {name} {metric_type}')
+
+    for (name, labels), value in counters:
+        describe(name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), value in gauges:
+        describe(name, 'gauge')
+        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), histogram in histograms:
+        describe(name, 'histogram')
+        for bound, count in zip(DURATION_BUCKETS, histogram['buckets']):
+            lines.append(f'{name}_bucket{_format_labels(labels, le=bound)} {count}')
+        lines.append(f'{name}_bucket{_format_labels(labels, le="+Inf")} {histogram["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram["sum"])}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path):
+    """
+    Атомарно записывает метрики в файл для textfile collector node_exporter.
+
+    Файл пишется во временный рядом и переименовывается, чтобы коллектор не прочитал его наполовину.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write(render())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def run_textfile_exporter(path, interval, stop_event=None):
+    """Переписывает файл метрик раз в `interval` секунд, пока не выставлен `stop_event`."""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.wait(interval):
+        try:
+            write_textfile(path)
+        except OSError:
+            logger.exception('Failed to write metrics to %s', path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+def start_http_server(port, host=''):
+    """Отдает метрики процесса по HTTP на /metrics в фоновом потоке, возвращает сервер."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info('Serving metrics on %s:%s/metrics', host or '*', server.server_address[1])
+    return server
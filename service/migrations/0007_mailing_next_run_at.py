@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:52
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_next_run_at(apps, schema_editor):
+    Mailing = apps.get_model('service', 'Mailing')
+    now = timezone.now()
+    mailings = Mailing.objects.filter(first_sent_at__isnull=False).select_related('frequency')
+    for mailing in mailings.iterator():
+        if mailing.first_sent_at > now:
+            mailing.next_run_at = mailing.first_sent_at
+        else:
+            period = timedelta(days=max(mailing.frequency.days_until_next_mailing, 1))
+            mailing.next_run_at = mailing.first_sent_at + period * ((now - mailing.first_sent_at) // period + 1)
+        mailing.save(update_fields=['next_run_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0006_alter_blogpost_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailing',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='дата следующей отправки'),
+        ),
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(condition=models.Q(('status__in', ['Новая', 'Запущена'])), fields=['next_run_at'], name='service_mailing_due_idx'),
+        ),
+        migrations.RunPython(fill_next_run_at, migrations.RunPython.noop),
+    ]
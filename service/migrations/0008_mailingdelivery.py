@@ -0,0 +1,30 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0007_mailing_next_run_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempted_at', models.DateTimeField(verbose_name='дата попытки')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Отправлено'), (2, 'Отклонено сервером'), (3, 'Ошибка отправки')], verbose_name='статус доставки')),
+                ('smtp_code', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='код ответа почтового сервера')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='service.client', verbose_name='клиент')),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='service.mailing', verbose_name='рассылка')),
+            ],
+            options={
+                'verbose_name': 'Доставка письма',
+                'verbose_name_plural': 'Доставки писем',
+                'indexes': [models.Index(fields=['mailing', 'attempted_at'], name='service_delivery_mailing_idx'), models.Index(fields=['client', 'attempted_at'], name='service_delivery_client_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0008_mailingdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='название')),
+                ('owner', models.CharField(blank=True, max_length=100, null=True, verbose_name='узел-владелец')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='срок аренды')),
+            ],
+            options={
+                'verbose_name': 'Аренда планировщика',
+                'verbose_name_plural': 'Аренды планировщика',
+            },
+        ),
+    ]
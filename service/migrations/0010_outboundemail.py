@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0009_schedulerlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=100, unique=True, verbose_name='ключ идемпотентности')),
+                ('recipients', models.JSONField(default=list, verbose_name='id получателей')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'В очереди'), (2, 'Отправляется'), (3, 'Отправлено'), (4, 'Не доставлено')], default=1, verbose_name='статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='количество попыток')),
+                ('available_at', models.DateTimeField(verbose_name='доступно для отправки с')),
+                ('locked_by', models.CharField(blank=True, max_length=100, null=True, verbose_name='обработчик')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='заблокировано до')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='последняя ошибка')),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='service.mailing', verbose_name='рассылка')),
+            ],
+            options={
+                'verbose_name': 'Письмо в очереди',
+                'verbose_name_plural': 'Очередь писем',
+                'indexes': [models.Index(fields=['status', 'available_at'], name='service_outbound_ready_idx'), models.Index(fields=['status', 'locked_until'], name='service_outbound_locked_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+def fill_counters(apps, schema_editor):
+    DashboardCounter = apps.get_model('service', 'DashboardCounter')
+    Mailing = apps.get_model('service', 'Mailing')
+    Client = apps.get_model('service', 'Client')
+    DashboardCounter.objects.bulk_create([
+        DashboardCounter(name='mailings', value=Mailing.objects.count()),
+        DashboardCounter(name='active_mailings', value=Mailing.objects.exclude(status='Завершена').count()),
+        DashboardCounter(name='clients', value=Client.objects.count()),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0011_list_seek_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='название')),
+                ('value', models.BigIntegerField(default=0, verbose_name='значение')),
+            ],
+            options={
+                'verbose_name': 'Счетчик главной страницы',
+                'verbose_name_plural': 'Счетчики главной страницы',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_stats(apps, schema_editor):
+    Mailing = apps.get_model('service', 'Mailing')
+    MailingAttempt = apps.get_model('service', 'MailingAttempt')
+    MailingDelivery = apps.get_model('service', 'MailingDelivery')
+    MailingDailyStat = apps.get_model('service', 'MailingDailyStat')
+
+    stats = {}
+    owners = dict(Mailing.objects.values_list('pk', 'creator_id'))
+    attempts = MailingAttempt.objects.annotate(day=TruncDate('last_attempt')).values('mailing', 'day').annotate(
+        attempts_success=Count('pk', filter=Q(is_success=True)),
+        attempts_failed=Count('pk', filter=~Q(is_success=True)),
+    )
+    deliveries = MailingDelivery.objects.annotate(day=TruncDate('attempted_at')).values('mailing', 'day').annotate(
+        deliveries_sent=Count('pk', filter=Q(status=1)),
+        deliveries_refused=Count('pk', filter=Q(status=2)),
+        deliveries_failed=Count('pk', filter=Q(status=3)),
+    )
+    for row in [*attempts, *deliveries]:
+        key = (row.pop('mailing'), row.pop('day'))
+        stat = stats.setdefault(key, MailingDailyStat(mailing_id=key[0], owner_id=owners.get(key[0]), day=key[1]))
+        for field, value in row.items():
+            setattr(stat, field, value)
+    MailingDailyStat.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0012_dashboardcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('attempts_success', models.PositiveIntegerField(default=0, verbose_name='успешных попыток')),
+                ('attempts_failed', models.PositiveIntegerField(default=0, verbose_name='неуспешных попыток')),
+                ('deliveries_sent', models.PositiveIntegerField(default=0, verbose_name='отправлено писем')),
+                ('deliveries_refused', models.PositiveIntegerField(default=0, verbose_name='отклонено писем')),
+                ('deliveries_failed', models.PositiveIntegerField(default=0, verbose_name='ошибок отправки писем')),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='service.mailing', verbose_name='рассылка')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='владелец')),
+            ],
+            options={
+                'verbose_name': 'Статистика рассылки за день',
+                'verbose_name_plural': 'Статистика рассылок по дням',
+                'indexes': [models.Index(fields=['owner', 'day'], name='service_dailystat_owner_idx'), models.Index(fields=['day'], name='service_dailystat_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mailingdailystat',
+            constraint=models.UniqueConstraint(fields=('mailing', 'day'), name='service_dailystat_mailing_day_uniq'),
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
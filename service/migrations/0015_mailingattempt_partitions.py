@@ -0,0 +1,101 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:06
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+TABLE = 'service_mailingattempt'
+COLUMNS = 'id, last_attempt, is_success, server_answer, mailing_id'
+PARTITIONS_AHEAD = 3
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def partition_attempts(apps, schema_editor):
+    """Переводит таблицу попыток на секционирование по месяцам (только PostgreSQL)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+    execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_old')
+    execute(f'ALTER TABLE {TABLE}_old RENAME CONSTRAINT {TABLE}_pkey TO {TABLE}_old_pkey')
+    execute('ALTER INDEX service_attempt_recent_idx RENAME TO service_attempt_recent_old_idx')
+    execute(f'ALTER TABLE {TABLE}_old ALTER COLUMN id DROP IDENTITY')
+
+    execute(f'CREATE SEQUENCE {TABLE}_id_seq')
+    execute(
+        f'CREATE TABLE {TABLE} ('
+        f"id bigint NOT NULL DEFAULT nextval('{TABLE}_id_seq'), "
+        'last_attempt timestamp with time zone NOT NULL, '
+        'is_success boolean NULL, '
+        'server_answer text NULL, '
+        'mailing_id bigint NOT NULL REFERENCES service_mailing (id) DEFERRABLE INITIALLY DEFERRED, '
+        f'CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, last_attempt)'
+        ') PARTITION BY RANGE (last_attempt)'
+    )
+    execute(f'ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id')
+    execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(last_attempt) FROM {TABLE}_old')
+        first_attempt = cursor.fetchone()[0]
+    current = add_months(timezone.localtime(), 0)
+    month = add_months(timezone.localtime(first_attempt or timezone.now()), 0)
+    while month <= add_months(current, PARTITIONS_AHEAD):
+        execute(
+            f'CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+            [month, add_months(month, 1)],
+        )
+        month = add_months(month, 1)
+
+    execute(f'CREATE INDEX {TABLE}_mailing_id_idx ON {TABLE} (mailing_id)')
+    execute(f'CREATE INDEX service_attempt_recent_idx ON {TABLE} (last_attempt DESC, id DESC)')
+    execute(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {TABLE}_old')
+    execute(f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)")
+    execute(f'DROP TABLE {TABLE}_old')
+
+
+def unpartition_attempts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+    execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_part')
+    execute(f'ALTER TABLE {TABLE}_part RENAME CONSTRAINT {TABLE}_pkey TO {TABLE}_part_pkey')
+    execute('ALTER INDEX service_attempt_recent_idx RENAME TO service_attempt_recent_part_idx')
+    execute(f'ALTER SEQUENCE {TABLE}_id_seq RENAME TO {TABLE}_part_id_seq')
+
+    execute(
+        f'CREATE TABLE {TABLE} ('
+        'id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, '
+        'last_attempt timestamp with time zone NOT NULL, '
+        'is_success boolean NULL, '
+        'server_answer text NULL, '
+        'mailing_id bigint NOT NULL REFERENCES service_mailing (id) DEFERRABLE INITIALLY DEFERRED'
+        ')'
+    )
+    execute(f'INSERT INTO {TABLE} ({COLUMNS}) OVERRIDING SYSTEM VALUE SELECT {COLUMNS} FROM {TABLE}_part')
+    execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+        f'COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)'
+    )
+    execute(f'DROP TABLE {TABLE}_part CASCADE')
+    execute(f'CREATE INDEX {TABLE}_mailing_id_idx ON {TABLE} (mailing_id)')
+    execute(f'CREATE INDEX service_attempt_recent_idx ON {TABLE} (last_attempt DESC, id DESC)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0014_blogpost_views_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mailingattempt',
+            index=models.Index(fields=['-last_attempt', '-id'], name='service_attempt_recent_idx'),
+        ),
+        migrations.RunPython(partition_attempts, unpartition_attempts),
+    ]
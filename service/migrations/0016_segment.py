@@ -0,0 +1,62 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0015_mailingattempt_partitions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mailing',
+            name='client_list',
+            field=models.ManyToManyField(blank=True, to='service.client', verbose_name='список клиентов'),
+        ),
+        migrations.CreateModel(
+            name='Segment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='название')),
+                ('rules', models.JSONField(default=list, verbose_name='условия')),
+                ('match', models.CharField(choices=[('all', 'Все условия'), ('any', 'Любое условие')], default='all', max_length=3, verbose_name='совпадение условий')),
+                ('is_materialized', models.BooleanField(default=False, verbose_name='хранить состав сегмента')),
+                ('materialized_at', models.DateTimeField(blank=True, null=True, verbose_name='дата обновления состава')),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='создатель')),
+            ],
+            options={
+                'verbose_name': 'Сегмент',
+                'verbose_name_plural': 'Сегменты',
+            },
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='service.segment', verbose_name='сегмент клиентов'),
+        ),
+        migrations.CreateModel(
+            name='SegmentMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='service.client', verbose_name='клиент')),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='service.segment', verbose_name='сегмент')),
+            ],
+            options={
+                'verbose_name': 'Клиент сегмента',
+                'verbose_name_plural': 'Состав сегментов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='segment',
+            index=models.Index(fields=['creator', 'id'], name='service_segment_creator_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='segmentmembership',
+            constraint=models.UniqueConstraint(fields=('segment', 'client'), name='service_segmentmembership_unique'),
+        ),
+    ]
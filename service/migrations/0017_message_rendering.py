@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0016_segment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='extra',
+            field=models.JSONField(blank=True, default=dict, verbose_name='дополнительные поля'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='version',
+            field=models.PositiveIntegerField(default=1, verbose_name='версия'),
+        ),
+    ]
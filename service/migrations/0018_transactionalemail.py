@@ -0,0 +1,36 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0017_message_rendering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionalEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='тема')),
+                ('body', models.TextField(blank=True, verbose_name='текст')),
+                ('from_email', models.CharField(blank=True, max_length=255, null=True, verbose_name='отправитель')),
+                ('recipients', models.JSONField(default=list, verbose_name='адреса получателей')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'В очереди'), (2, 'Отправляется'), (3, 'Отправлено'), (4, 'Не доставлено')], default=1, verbose_name='статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='количество попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='доступно для отправки с')),
+                ('locked_by', models.CharField(blank=True, max_length=100, null=True, verbose_name='обработчик')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='заблокировано до')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Служебное письмо',
+                'verbose_name_plural': 'Служебные письма',
+                'indexes': [models.Index(fields=['status', 'available_at'], name='service_transact_ready_idx'), models.Index(fields=['status', 'locked_until'], name='service_transact_locked_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0018_transactionalemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='schedulerlease',
+            name='name',
+            field=models.CharField(max_length=150, unique=True, verbose_name='название'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class KeysetPaginationMixin:
+    """
+    Постраничный вывод списка по ключу (seek-пагинация).
+
+    Следующая страница выбирается условием pk < последнего показанного pk вместо OFFSET,
+    поэтому стоимость запроса не зависит от номера страницы и размера таблицы.
+
+    Если задано `seek_field` (поле даты и времени), список сортируется сначала по нему, а затем по pk.
+    Так условие страницы попадает на ключ секционирования и запрос читает только нужные секции.
+    """
+    page_size = 20
+    cursor_kwarg = 'after'
+    seek_field = None
+
+    def get_ordering_fields(self):
+        return (f'-{self.seek_field}', '-pk') if self.seek_field else ('-pk',)
+
+    def parse_cursor(self, cursor):
+        """Курсор - это `pk` или, при заданном `seek_field`, `микросекунды-pk`."""
+        if not self.seek_field:
+            return Q(pk__lt=int(cursor)) if cursor.isdigit() else None
+        micros, _, pk = cursor.partition('-')
+        if not (micros.isdigit() and pk.isdigit()):
+            return None
+        value = EPOCH + int(micros) * MICROSECOND
+        return Q(**{f'{self.seek_field}__lt': value}) | Q(**{self.seek_field: value, 'pk__lt': int(pk)})
+
+    def make_cursor(self, obj):
+        if not self.seek_field:
+            return obj.pk
+        return f'{(getattr(obj, self.seek_field) - EPOCH) // MICROSECOND}-{obj.pk}'
+
+    def get_context_data(self, **kwargs):
+        queryset = kwargs.pop('object_list', self.object_list)
+        condition = self.parse_cursor(self.request.GET.get(self.cursor_kwarg, ''))
+        if condition is not None:
+            queryset = queryset.filter(condition)
+        page = list(queryset.order_by(*self.get_ordering_fields())[:self.page_size + 1])
+        has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+
+        context = super().get_context_data(object_list=page, **kwargs)
+        context['next_cursor'] = self.make_cursor(page[-1]) if has_next else None
+        context['is_first_page'] = condition is None
+        return context
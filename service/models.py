@@ -1,4 +1,7 @@
+from datetime import timedelta
+
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from users.models import User
@@ -12,6 +15,7 @@ class Client(models.Model):
     first_name = models.CharField(max_length=50, verbose_name='имя')
     middle_name = models.CharField(max_length=50, verbose_name='отчество', **NULLABLE)
     comment = models.TextField(verbose_name='комментарий', **NULLABLE)
+    extra = models.JSONField(default=dict, blank=True, verbose_name='дополнительные поля')
     creator = models.ForeignKey(User, verbose_name='создатель', on_delete=models.RESTRICT, **NULLABLE)
 
     def __str__(self):
@@ -35,19 +39,76 @@ class Client(models.Model):
     class Meta:
         verbose_name = 'Клиент'
         verbose_name_plural = 'Клиенты'
+        indexes = [
+            # поддерживает seek-пагинацию списка владельца: creator = X AND id < Y ORDER BY id DESC
+            models.Index(fields=['creator', 'id'], name='service_client_creator_idx'),
+        ]
+
+
+class Segment(models.Model):
+    class MatchOfRules(models.TextChoices):
+        ALL = 'all', _('Все условия')
+        ANY = 'any', _('Любое условие')
+
+    name = models.CharField(max_length=100, verbose_name='название')
+    rules = models.JSONField(default=list, verbose_name='условия')
+    match = models.CharField(max_length=3, choices=MatchOfRules, default=MatchOfRules.ALL,
+                             verbose_name='совпадение условий')
+    is_materialized = models.BooleanField(default=False, verbose_name='хранить состав сегмента')
+    materialized_at = models.DateTimeField(**NULLABLE, verbose_name='дата обновления состава')
+    creator = models.ForeignKey(User, verbose_name='создатель', on_delete=models.CASCADE, **NULLABLE)
+
+    def __str__(self):
+        return f"{self.name}"
+
+    class Meta:
+        verbose_name = 'Сегмент'
+        verbose_name_plural = 'Сегменты'
+        indexes = [
+            models.Index(fields=['creator', 'id'], name='service_segment_creator_idx'),
+        ]
+
+
+class SegmentMembership(models.Model):
+    segment = models.ForeignKey('Segment', verbose_name='сегмент', on_delete=models.CASCADE)
+    client = models.ForeignKey('Client', verbose_name='клиент', on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"{self.segment_id} {self.client_id}"
+
+    class Meta:
+        verbose_name = 'Клиент сегмента'
+        verbose_name_plural = 'Состав сегментов'
+        constraints = [
+            models.UniqueConstraint(fields=['segment', 'client'], name='service_segmentmembership_unique'),
+        ]
 
 
 class Message(models.Model):
     title = models.CharField(max_length=50, verbose_name='тема письма')
     body = models.TextField(verbose_name='тело письма')
     creator = models.ForeignKey(User, verbose_name='создатель', on_delete=models.RESTRICT, **NULLABLE)
+    version = models.PositiveIntegerField(default=1, verbose_name='версия')
 
     def __str__(self):
         return f"{self.title}"
 
+    def save(self, *args, **kwargs):
+        # по версии кэшируются скомпилированные шаблоны письма, поэтому любое изменение ее увеличивает
+        if self.pk is not None and not self._state.adding:
+            self.version = models.F('version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        if not isinstance(self.version, int):
+            self.refresh_from_db(fields=['version'])
+
     class Meta:
         verbose_name = 'Сообщение'
         verbose_name_plural = 'Сообщения'
+        indexes = [
+            models.Index(fields=['creator', 'id'], name='service_message_creator_idx'),
+        ]
 
 
 class Mailing(models.Model):
@@ -59,16 +120,48 @@ class Mailing(models.Model):
     first_sent_at = models.DateTimeField(**NULLABLE, verbose_name='дата первой отправки')
     frequency = models.ForeignKey('Frequency', verbose_name='частота отправки рассылки', on_delete=models.RESTRICT)
     status = models.CharField(verbose_name='статус рассылки', choices=StatusOfMailing, default=StatusOfMailing.NEW)
-    client_list = models.ManyToManyField('Client', verbose_name='список клиентов')
+    client_list = models.ManyToManyField('Client', verbose_name='список клиентов', blank=True)
+    segment = models.ForeignKey('Segment', verbose_name='сегмент клиентов', on_delete=models.SET_NULL, **NULLABLE)
     message_to_send = models.ForeignKey('Message', verbose_name='сообщение для отправки', on_delete=models.RESTRICT)
     creator = models.ForeignKey(User, verbose_name='создатель', on_delete=models.RESTRICT, **NULLABLE)
+    next_run_at = models.DateTimeField(**NULLABLE, verbose_name='дата следующей отправки')
 
     def __str__(self):
         return f"{self.status}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # статус на момент загрузки нужен счетчикам главной страницы, чтобы учесть смену статуса
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.next_run_at is None and self.first_sent_at is not None:
+            self.next_run_at = self.get_next_run_at(timezone.now())
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'next_run_at'}
+        super().save(*args, **kwargs)
+
+    def get_next_run_at(self, after):
+        """Возвращает ближайшую дату отправки по расписанию, наступающую позже `after`."""
+        if self.first_sent_at is None:
+            return None
+        if self.first_sent_at > after:
+            return self.first_sent_at
+        period = timedelta(days=max(self.frequency.days_until_next_mailing, 1))
+        periods_passed = (after - self.first_sent_at) // period + 1
+        return self.first_sent_at + period * periods_passed
+
     class Meta:
         verbose_name = 'Рассылка'
         verbose_name_plural = 'Рассылки'
+        indexes = [
+            models.Index(fields=['creator', 'id'], name='service_mailing_creator_idx'),
+            # частичный индекс по активным рассылкам: тик планировщика выбирает только наступившие отправки
+            models.Index(fields=['next_run_at'], name='service_mailing_due_idx',
+                         condition=models.Q(status__in=['Новая', 'Запущена'])),
+        ]
         permissions = [
             ('can_view_all_mailings', 'Can view all mailings'),
             ('can_change_status', 'Can change status of all mailings')
@@ -87,6 +180,117 @@ class MailingAttempt(models.Model):
     class Meta:
         verbose_name = 'Попытка рассылки'
         verbose_name_plural = 'Попытки рассылки'
+        indexes = [
+            models.Index(fields=['-last_attempt', '-id'], name='service_attempt_recent_idx'),
+        ]
+
+
+class MailingDelivery(models.Model):
+    class StatusOfDelivery(models.IntegerChoices):
+        SENT = 1, _('Отправлено')
+        REFUSED = 2, _('Отклонено сервером')
+        FAILED = 3, _('Ошибка отправки')
+
+    attempted_at = models.DateTimeField(verbose_name='дата попытки')
+    status = models.PositiveSmallIntegerField(choices=StatusOfDelivery, verbose_name='статус доставки')
+    smtp_code = models.PositiveSmallIntegerField(**NULLABLE, verbose_name='код ответа почтового сервера')
+    mailing = models.ForeignKey('Mailing', verbose_name='рассылка', on_delete=models.RESTRICT)
+    client = models.ForeignKey('Client', verbose_name='клиент', on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"{self.attempted_at} {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = 'Доставка письма'
+        verbose_name_plural = 'Доставки писем'
+        indexes = [
+            models.Index(fields=['mailing', 'attempted_at'], name='service_delivery_mailing_idx'),
+            models.Index(fields=['client', 'attempted_at'], name='service_delivery_client_idx'),
+        ]
+
+
+class MailingDailyStat(models.Model):
+    mailing = models.ForeignKey('Mailing', verbose_name='рассылка', on_delete=models.CASCADE)
+    owner = models.ForeignKey(User, verbose_name='владелец', on_delete=models.CASCADE, **NULLABLE)
+    day = models.DateField(verbose_name='день')
+    attempts_success = models.PositiveIntegerField(default=0, verbose_name='успешных попыток')
+    attempts_failed = models.PositiveIntegerField(default=0, verbose_name='неуспешных попыток')
+    deliveries_sent = models.PositiveIntegerField(default=0, verbose_name='отправлено писем')
+    deliveries_refused = models.PositiveIntegerField(default=0, verbose_name='отклонено писем')
+    deliveries_failed = models.PositiveIntegerField(default=0, verbose_name='ошибок отправки писем')
+
+    def __str__(self):
+        return f"{self.mailing_id} {self.day}"
+
+    class Meta:
+        verbose_name = 'Статистика рассылки за день'
+        verbose_name_plural = 'Статистика рассылок по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'day'], name='service_dailystat_mailing_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'day'], name='service_dailystat_owner_idx'),
+            models.Index(fields=['day'], name='service_dailystat_day_idx'),
+        ]
+
+
+class OutboundEmail(models.Model):
+    class StatusOfOutbound(models.IntegerChoices):
+        PENDING = 1, _('В очереди')
+        PROCESSING = 2, _('Отправляется')
+        SENT = 3, _('Отправлено')
+        DEAD = 4, _('Не доставлено')
+
+    idempotency_key = models.CharField(max_length=100, unique=True, verbose_name='ключ идемпотентности')
+    mailing = models.ForeignKey('Mailing', verbose_name='рассылка', on_delete=models.CASCADE)
+    recipients = models.JSONField(default=list, verbose_name='id получателей')
+    status = models.PositiveSmallIntegerField(choices=StatusOfOutbound, default=StatusOfOutbound.PENDING,
+                                              verbose_name='статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='количество попыток')
+    available_at = models.DateTimeField(verbose_name='доступно для отправки с')
+    locked_by = models.CharField(max_length=100, verbose_name='обработчик', **NULLABLE)
+    locked_until = models.DateTimeField(verbose_name='заблокировано до', **NULLABLE)
+    last_error = models.TextField(verbose_name='последняя ошибка', **NULLABLE)
+
+    def __str__(self):
+        return f"{self.idempotency_key} {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Очередь писем'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='service_outbound_ready_idx'),
+            models.Index(fields=['status', 'locked_until'], name='service_outbound_locked_idx'),
+        ]
+
+
+class TransactionalEmail(models.Model):
+    """Служебное письмо (подтверждение почты, восстановление пароля), которое отправляет обработчик очереди."""
+    StatusOfOutbound = OutboundEmail.StatusOfOutbound
+
+    subject = models.CharField(max_length=255, verbose_name='тема')
+    body = models.TextField(verbose_name='текст', blank=True)
+    from_email = models.CharField(max_length=255, verbose_name='отправитель', **NULLABLE)
+    recipients = models.JSONField(default=list, verbose_name='адреса получателей')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='создано')
+    status = models.PositiveSmallIntegerField(choices=StatusOfOutbound, default=StatusOfOutbound.PENDING,
+                                              verbose_name='статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='количество попыток')
+    available_at = models.DateTimeField(default=timezone.now, verbose_name='доступно для отправки с')
+    locked_by = models.CharField(max_length=100, verbose_name='обработчик', **NULLABLE)
+    locked_until = models.DateTimeField(verbose_name='заблокировано до', **NULLABLE)
+    last_error = models.TextField(verbose_name='последняя ошибка', **NULLABLE)
+
+    def __str__(self):
+        return f"{self.subject} {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = 'Служебное письмо'
+        verbose_name_plural = 'Служебные письма'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='service_transact_ready_idx'),
+            models.Index(fields=['status', 'locked_until'], name='service_transact_locked_idx'),
+        ]
 
 
 class Frequency(models.Model):
@@ -115,6 +319,46 @@ class BlogPost(models.Model):
     class Meta:
         verbose_name = 'Пост блога'
         verbose_name_plural = 'Посты блога'
+        indexes = [
+            models.Index(fields=['-view_count', '-id'], name='service_blogpost_views_idx'),
+        ]
         permissions = [
             ('can_view_blog_posts', 'Can view all posts')
         ]
+
+
+class SchedulerLease(models.Model):
+    name = models.CharField(max_length=150, unique=True, verbose_name='название')
+    owner = models.CharField(max_length=100, verbose_name='узел-владелец', **NULLABLE)
+    expires_at = models.DateTimeField(verbose_name='срок аренды', **NULLABLE)
+
+    def __str__(self):
+        return f"{self.name} {self.owner}"
+
+    class Meta:
+        verbose_name = 'Аренда планировщика'
+        verbose_name_plural = 'Аренды планировщика'
+
+
+class DashboardCounter(models.Model):
+    MAILINGS = 'mailings'
+    ACTIVE_MAILINGS = 'active_mailings'
+    CLIENTS = 'clients'
+
+    name = models.CharField(max_length=50, unique=True, verbose_name='название')
+    value = models.BigIntegerField(default=0, verbose_name='значение')
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def get_values(cls):
+        return dict(cls.objects.values_list('name', 'value'))
+
+    @classmethod
+    def increment(cls, name, delta=1):
+        cls.objects.filter(name=name).update(value=models.F('value') + delta)
+
+    class Meta:
+        verbose_name = 'Счетчик главной страницы'
+        verbose_name_plural = 'Счетчики главной страницы'
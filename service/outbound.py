@@ -0,0 +1,127 @@
+import logging
+import smtplib
+from concurrent.futures import as_completed
+from datetime import timedelta
+
+from django.conf import settings as django_conf
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from service import metrics
+from service.coordination import NODE_ID
+from service.mail import PartialDeliveryError
+from service.models import OutboundEmail, TransactionalEmail
+
+logger = logging.getLogger(__name__)
+
+# Очереди писем: общие для очереди рассылок и служебных писем функции захвата, отправки и учета попыток.
+# Модуль не зависит от планировщика, поэтому его можно импортировать из веб-представлений.
+
+
+def dispatch_messages(pool, rate_limiter, messages):
+    """
+    Отправляет пачку писем в рабочем потоке.
+
+    Возвращает (успешность, ответ сервера, отклоненные адреса, код ошибки, неотправленные адреса).
+    """
+    rate_limiter.wait(len(messages))
+    try:
+        with metrics.span('send', emails=len(messages)):
+            refused = pool.deliver(messages)
+        return True, len(messages), refused, None, set()
+    except PartialDeliveryError as e:
+        unsent = {address for message in messages[e.sent:] for address in message.recipients()}
+        return False, e.error, e.refused, e.smtp_code, unsent
+    except (smtplib.SMTPException, OSError) as e:
+        unsent = {address for message in messages for address in message.recipients()}
+        return False, e, {}, getattr(e, 'smtp_code', None), unsent
+
+
+def claim_outbound_emails(current_datetime, limit, queryset=None):
+    """
+    Забирает готовые к отправке письма из очереди.
+
+    Письма, зависшие в обработке дольше MAILING_QUEUE_VISIBILITY (упавший обработчик), забираются повторно.
+    Подходит для очереди рассылок и очереди служебных писем: у моделей одинаковые поля состояния.
+    """
+    queryset = queryset if queryset is not None else OutboundEmail.objects.select_related('mailing__message_to_send')
+    with transaction.atomic():
+        outbound_emails = list(queryset.filter(
+            Q(status=OutboundEmail.StatusOfOutbound.PENDING, available_at__lte=current_datetime)
+            | Q(status=OutboundEmail.StatusOfOutbound.PROCESSING, locked_until__lte=current_datetime)
+        ).select_for_update(
+            skip_locked=True, of=('self',)
+        ).order_by('available_at')[:limit])
+        for outbound_email in outbound_emails:
+            outbound_email.status = OutboundEmail.StatusOfOutbound.PROCESSING
+            outbound_email.locked_by = NODE_ID
+            outbound_email.locked_until = current_datetime + timedelta(seconds=django_conf.MAILING_QUEUE_VISIBILITY)
+        queryset.model.objects.bulk_update(outbound_emails, ['status', 'locked_by', 'locked_until'])
+    return outbound_emails
+
+
+def complete_outbound_email(outbound_email, is_success, server_answer, finished_at):
+    """Фиксирует результат попытки: письмо отправлено, отложено с экспоненциальной задержкой или списано."""
+    outbound_email.attempts += 1
+    outbound_email.locked_by = outbound_email.locked_until = None
+    queue = outbound_email._meta.model_name
+    if is_success:
+        outbound_email.status = OutboundEmail.StatusOfOutbound.SENT
+        outbound_email.last_error = None
+        metrics.increment('outbound_emails_total', result='sent', queue=queue)
+    elif outbound_email.attempts >= django_conf.MAILING_RETRY_MAX:
+        outbound_email.status = OutboundEmail.StatusOfOutbound.DEAD
+        outbound_email.last_error = str(server_answer)
+        metrics.increment('outbound_emails_total', result='dead', queue=queue)
+    else:
+        metrics.increment('outbound_emails_total', result='retried', queue=queue)
+        outbound_email.status = OutboundEmail.StatusOfOutbound.PENDING
+        outbound_email.last_error = str(server_answer)
+        backoff = django_conf.MAILING_RETRY_BACKOFF * 2 ** (outbound_email.attempts - 1)
+        outbound_email.available_at = finished_at + timedelta(seconds=backoff)
+
+
+def send_transactional_email(subject, message, recipient_list, from_email=None):
+    """
+    Ставит служебное письмо в очередь вместо отправки из запроса.
+
+    Запрос не ждет SMTP-сервер и не падает при его недоступности: письмо отправит обработчик очереди,
+    при ошибке - повторно с экспоненциальной задержкой, как письма рассылок. Вызывается в транзакции
+    вместе с изменением пользователя, чтобы письмо не ушло при откате и не потерялось при падении.
+    """
+    return TransactionalEmail.objects.create(subject=subject, body=message, from_email=from_email,
+                                             recipients=list(recipient_list))
+
+
+def process_transactional_queue(pool, executor, rate_limiter):
+    """Отправляет порцию служебных писем из очереди, возвращает число обработанных писем."""
+    emails = claim_outbound_emails(timezone.now(), django_conf.MAILING_QUEUE_CLAIM,
+                                   queryset=TransactionalEmail.objects.all())
+    if not emails:
+        return 0
+
+    futures = {}
+    for email in emails:
+        message = EmailMessage(subject=email.subject, body=email.body,
+                               from_email=email.from_email or django_conf.DEFAULT_FROM_EMAIL, to=email.recipients)
+        futures[executor.submit(dispatch_messages, pool, rate_limiter, [message])] = email
+
+    for future in as_completed(futures):
+        email = futures[future]
+        is_success, server_answer, refused = future.result()[:3]
+        if is_success and refused:
+            # у служебного письма один получатель: отказ по адресу - такая же ошибка, как отказ всего письма
+            is_success, server_answer = False, refused
+        complete_outbound_email(email, is_success, server_answer, timezone.now())
+        if email.status != TransactionalEmail.StatusOfOutbound.PENDING:
+            # текст может содержать пароль или ссылку подтверждения, после отправки он не хранится
+            email.body = ''
+
+    with metrics.span('persist', step='transactional'):
+        TransactionalEmail.objects.bulk_update(
+            emails, ['status', 'attempts', 'available_at', 'locked_by', 'locked_until', 'last_error', 'body']
+        )
+    logger.info('Processed %s transactional emails', len(emails))
+    return len(emails)
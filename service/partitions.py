@@ -0,0 +1,185 @@
+import csv
+import gzip
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from service.coordination import claim_leadership
+from service.models import MailingAttempt
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_TABLE = MailingAttempt._meta.db_table
+ATTEMPT_COLUMNS = ['id', 'last_attempt', 'is_success', 'server_answer', 'mailing_id']
+
+
+def month_start(value):
+    value = timezone.localtime(value)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def partition_name(month):
+    return f'{ATTEMPT_TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned():
+    """Секционирование есть только в PostgreSQL, на других базах таблица попыток обычная."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [ATTEMPT_TABLE])
+        return cursor.fetchone() is not None
+
+
+def get_partitions():
+    """Месячные секции таблицы попыток: {начало месяца: имя секции}, без секции по умолчанию."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = %s::regclass',
+            [ATTEMPT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f'{ATTEMPT_TABLE}_p'
+    return {
+        timezone.make_aware(datetime.strptime(name[len(prefix):], '%Y%m')): name
+        for name in names if name.startswith(prefix)
+    }
+
+
+def create_partition(month):
+    """
+    Создает секцию за месяц.
+
+    Попытки этого месяца, уже попавшие в секцию по умолчанию, переносятся в новую секцию
+    до ее подключения, иначе PostgreSQL не даст подключить секцию с пересекающимися строками.
+    """
+    name = partition_name(month)
+    columns = ', '.join(ATTEMPT_COLUMNS)
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {ATTEMPT_TABLE} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {ATTEMPT_TABLE}_default '
+            f'WHERE last_attempt >= %s AND last_attempt < %s RETURNING {columns}) '
+            f'INSERT INTO {name} ({columns}) SELECT {columns} FROM moved',
+            bounds,
+        )
+        cursor.execute(
+            f'ALTER TABLE {ATTEMPT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+            bounds,
+        )
+    logger.info('Created partition %s', name)
+
+
+def ensure_partitions(now=None, months_ahead=None):
+    """Заранее создает секции на текущий и `months_ahead` следующих месяцев."""
+    if not is_partitioned():
+        return []
+    months_ahead = settings.MAILING_ATTEMPT_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(now or timezone.now())
+    existing = get_partitions()
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            create_partition(month)
+            created.append(partition_name(month))
+    return created
+
+
+def _write_archive(path, rows):
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(ATTEMPT_COLUMNS)
+        writer.writerows(rows)
+
+
+def _copy_to(cursor, sql, file):
+    """Выполняет COPY ... TO STDOUT в файл: cursor.copy в psycopg 3, cursor.copy_expert в psycopg2."""
+    if hasattr(cursor, 'copy'):
+        with cursor.copy(sql) as copy:
+            for data in copy:
+                file.write(data)
+    else:
+        cursor.copy_expert(sql, file)
+
+
+def archive_partition(name, archive_dir):
+    """Выгружает секцию в сжатый CSV и отключает ее от таблицы; DROP не оставляет мертвых строк, в отличие от DELETE."""
+    path = Path(archive_dir) / f'{name}.csv.gz'
+    with connection.cursor() as cursor, gzip.open(path, 'wb') as file:
+        _copy_to(
+            cursor,
+            f'COPY (SELECT {", ".join(ATTEMPT_COLUMNS)} FROM {name} ORDER BY id) TO STDOUT WITH CSV HEADER',
+            file,
+        )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {ATTEMPT_TABLE} DETACH PARTITION {name}')
+        cursor.execute(f'DROP TABLE {name}')
+    return path
+
+
+def archive_rows(cutoff, archive_dir):
+    """
+    Выгрузка и удаление попыток старше `cutoff` построчно.
+
+    Так архивируется таблица без секционирования (SQLite и т.п.), а в PostgreSQL - секция по умолчанию,
+    куда попадают попытки за месяцы без своей секции.
+    """
+    queryset = MailingAttempt.objects.filter(last_attempt__lt=cutoff)
+    last_id = queryset.order_by('-pk').values_list('pk', flat=True).first()
+    if last_id is None:
+        return None
+    queryset = queryset.filter(pk__lte=last_id)
+    path = Path(archive_dir) / f'{ATTEMPT_TABLE}_before_{cutoff:%Y%m}.csv.gz'
+    _write_archive(path, queryset.order_by('pk').values_list(*ATTEMPT_COLUMNS).iterator(chunk_size=2000))
+    queryset.delete()
+    return path
+
+
+def archive_old_attempts(now=None, retention_months=None, archive_dir=None):
+    """
+    Выгружает попытки старше `retention_months` месяцев в сжатые файлы в `archive_dir` и удаляет их из базы.
+
+    Статистика по ним остается в ежедневных сводках MailingDailyStat.
+    Возвращает пути созданных архивов.
+    """
+    retention_months = settings.MAILING_ATTEMPT_RETENTION_MONTHS if retention_months is None else retention_months
+    archive_dir = archive_dir or settings.MAILING_ATTEMPT_ARCHIVE_DIR
+    cutoff = add_months(month_start(now or timezone.now()), -retention_months)
+    Path(archive_dir).mkdir(parents=True, exist_ok=True)
+
+    if not is_partitioned():
+        path = archive_rows(cutoff, archive_dir)
+        return [path] if path else []
+
+    paths = []
+    for month, name in sorted(get_partitions().items()):
+        if month < cutoff:
+            paths.append(archive_partition(name, archive_dir))
+            logger.info('Archived partition %s to %s', name, paths[-1])
+    # старые месячные секции уже отключены, остались только строки секции по умолчанию
+    path = archive_rows(cutoff, archive_dir)
+    if path:
+        paths.append(path)
+        logger.info('Archived old attempts of %s_default to %s', ATTEMPT_TABLE, path)
+    return paths
+
+
+def maintain_attempt_partitions():
+    """Задача планировщика: секции на будущие месяцы и архивация старых. Выполняется только ведущим узлом."""
+    if not claim_leadership():
+        return
+    ensure_partitions()
+    archive_old_attempts()
@@ -0,0 +1,272 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+# профиль текущего запроса, по нему перехватчики шаблонов и кэша понимают, что запрос замеряется
+_current = contextvars.ContextVar('request_profile', default=None)
+
+_install_lock = threading.Lock()
+
+FIELDS = ('wall', 'sql_count', 'sql_time', 'template_time', 'cache_hits', 'cache_misses')
+
+
+class RequestProfile:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.wall = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # обертка connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+
+
+class ProfileAggregator:
+    """
+    Сводка профилей запросов в памяти процесса по имени маршрута.
+
+    По каждому маршруту копятся число запросов, сумма и максимум каждого замера. Раз в `dump_interval`
+    секунд фоновый поток пишет сводку в журнал (`top` самых затратных по суммарному времени маршрутов) и,
+    если задан `dump_path`, в JSON-файл, после чего начинается новый интервал. У каждого процесса
+    (воркера gunicorn) своя сводка, поэтому к имени файла добавляется pid: `profile.json` -> `profile.<pid>.json`.
+    """
+
+    def __init__(self, dump_interval=None, dump_path=None, top=None):
+        self.dump_interval = settings.PROFILING_DUMP_INTERVAL if dump_interval is None else dump_interval
+        self.dump_path = settings.PROFILING_DUMP_PATH if dump_path is None else dump_path
+        self.top = settings.PROFILING_DUMP_TOP if top is None else top
+        self._lock = threading.Lock()
+        self._views = {}
+        self._started_at = time.time()
+        self._dumper_pid = None
+
+    def _ensure_dumper(self):
+        # запись файла не выполняется в замеряемом запросе; после fork поток запускается заново
+        if self._dumper_pid == os.getpid():
+            return
+        self._dumper_pid = os.getpid()
+        threading.Thread(target=self._run_dumper, name='profile-dumper', daemon=True).start()
+
+    def _run_dumper(self):
+        while True:
+            time.sleep(self.dump_interval)
+            try:
+                self.dump()
+            except Exception:
+                logger.exception('Request profile dump failed')
+
+    def add(self, view_name, profile, status_code):
+        with self._lock:
+            self._ensure_dumper()
+            view = self._views.get(view_name)
+            if view is None:
+                view = self._views[view_name] = dict(
+                    {'count': 0, 'errors': 0}, **{f'{field}_total': 0 for field in FIELDS},
+                    **{f'{field}_max': 0 for field in FIELDS},
+                )
+            view['count'] += 1
+            view['errors'] += status_code >= 500
+            for field in FIELDS:
+                value = getattr(profile, field)
+                view[f'{field}_total'] += value
+                view[f'{field}_max'] = max(view[f'{field}_max'], value)
+
+    def snapshot(self, reset=False):
+        """Сводка по маршрутам со средними значениями, от самого затратного по суммарному времени."""
+        with self._lock:
+            views, started_at = self._views, self._started_at
+            if reset:
+                self._views, self._started_at = {}, time.time()
+            else:
+                views = {name: dict(view) for name, view in views.items()}
+
+        rows = []
+        for name, view in sorted(views.items(), key=lambda item: item[1]['wall_total'], reverse=True):
+            row = {'view': name, 'count': view['count'], 'errors': view['errors']}
+            for field in FIELDS:
+                total = view[f'{field}_total']
+                row[f'{field}_avg'] = round(total / view['count'], 6)
+                row[f'{field}_max'] = round(view[f'{field}_max'], 6)
+                if field in ('wall', 'sql_time', 'template_time'):
+                    row[f'{field}_total'] = round(total, 6)
+            rows.append(row)
+        return {
+            'pid': os.getpid(),
+            'started_at': datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'sample_rate': settings.PROFILING_SAMPLE_RATE,
+            'views': rows,
+        }
+
+    def dump(self):
+        report = self.snapshot(reset=True)
+        if not report['views']:
+            return report
+        for row in report['views'][:self.top]:
+            logger.info(
+                'profile view=%s count=%s errors=%s wall_avg=%.4f wall_max=%.4f sql_avg=%.1f sql_time_avg=%.4f '
+                'template_avg=%.4f cache_hits_avg=%.1f cache_misses_avg=%.1f',
+                row['view'], row['count'], row['errors'], row['wall_avg'], row['wall_max'], row['sql_count_avg'],
+                row['sql_time_avg'], row['template_time_avg'], row['cache_hits_avg'], row['cache_misses_avg'],
+            )
+        if self.dump_path:
+            try:
+                self._write(report)
+            except OSError:
+                logger.exception('Failed to write request profile to %s', self.get_dump_path())
+        return report
+
+    def get_dump_path(self):
+        root, extension = os.path.splitext(self.dump_path)
+        return f'{root}.{os.getpid()}{extension}'
+
+    def _write(self, report):
+        # файл переписывается атомарно, чтобы читатель не застал его наполовину записанным
+        path = self.get_dump_path()
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.profile-',
+                                                 suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def _profile_template_render(render):
+    def wrapper(self, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile.template_time += time.perf_counter() - started
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def _profile_cache_get(get):
+    def wrapper(self, key, default=None, version=None):
+        profile = _current.get()
+        if profile is None:
+            return get(self, key, default, version)
+        # отдельный маркер отличает промах от закэшированного значения, равного default
+        missing = object()
+        value = get(self, key, missing, version)
+        if value is missing:
+            profile.cache_misses += 1
+            return default
+        profile.cache_hits += 1
+        return value
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def _profile_cache_get_many(get_many):
+    def wrapper(self, keys, version=None):
+        profile = _current.get()
+        if profile is None:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        # get_many по умолчанию вызывает get для каждого ключа, такие обращения не считаются дважды
+        token = _current.set(None)
+        try:
+            values = get_many(self, keys, version)
+        finally:
+            _current.reset(token)
+        profile.cache_hits += len(values)
+        profile.cache_misses += len(keys) - len(values)
+        return values
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def install_hooks():
+    """
+    Подключает замер шаблонов и кэша.
+
+    Перехватывается отрисовка шаблона верхнего уровня (вложенные include входят в его время) и чтение
+    кэша у классов настроенных бэкендов. Вне замеряемого запроса перехватчики ничего не делают.
+    """
+    with _install_lock:
+        if not getattr(Template.render, 'profiled', False):
+            Template.render = _profile_template_render(Template.render)
+        for alias in settings.CACHES:
+            backend_class = type(caches[alias])
+            if not getattr(backend_class.get, 'profiled', False):
+                backend_class.get = _profile_cache_get(backend_class.get)
+            if not getattr(backend_class.get_many, 'profiled', False):
+                backend_class.get_many = _profile_cache_get_many(backend_class.get_many)
+
+
+class ProfilingMiddleware:
+    """
+    Выборочно профилирует запросы: время ответа, число и время SQL-запросов, время шаблонов и обращения к кэшу.
+
+    Включается ненулевым PROFILING_SAMPLE_RATE - долей замеряемых запросов; при нуле Django исключает
+    middleware из цепочки. Для потоковых ответов замеряется только время до первого байта.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        install_hooks()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            profile.wall = time.perf_counter() - started
+            _current.reset(token)
+
+        resolver_match = request.resolver_match
+        view_name = resolver_match.view_name if resolver_match else '<unresolved>'
+        request_profiler.add(view_name, profile, response.status_code)
+        return response
+
+
+request_profiler = ProfileAggregator()
+atexit.register(request_profiler.dump)
@@ -0,0 +1,72 @@
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+# подстановки вида {{ first_name }}; имена, которых нет среди полей клиента, ищутся в Client.extra
+PLACEHOLDER = re.compile(r'\{\{\s*((?!\d)\w+)\s*\}\}')
+CLIENT_FIELDS = ('email', 'first_name', 'last_name', 'middle_name')
+RECIPIENT_FIELDS = ('pk', *CLIENT_FIELDS, 'extra')
+
+
+class RecipientValues(dict):
+    """Значения подстановок получателя; неизвестное имя подставляется пустой строкой."""
+
+    def __missing__(self, key):
+        return ''
+
+
+def get_recipient_values(recipient):
+    """Собирает подстановки из строки values(*RECIPIENT_FIELDS) один раз на получателя."""
+    values = RecipientValues(recipient['extra'] or {})
+    for field in CLIENT_FIELDS:
+        values[field] = recipient[field] or ''
+    return values
+
+
+class CompiledTemplate:
+    """
+    Шаблон, разобранный один раз в строку формата.
+
+    Отрисовка - это один вызов str.format_map, без повторного разбора текста на каждого получателя.
+    """
+
+    def __init__(self, text):
+        parts = [
+            f'{{{piece}}}' if index % 2 else piece.replace('{', '{{').replace('}', '}}')
+            for index, piece in enumerate(PLACEHOLDER.split(text))
+        ]
+        self.text = text
+        self.is_static = len(parts) == 1
+        self._format = ''.join(parts)
+
+    def render(self, values):
+        return self.text if self.is_static else self._format.format_map(values)
+
+
+class CompiledMessage:
+    def __init__(self, message):
+        self.subject = CompiledTemplate(message.title)
+        self.body = CompiledTemplate(message.body)
+        self.is_static = self.subject.is_static and self.body.is_static
+
+
+_compiled_messages = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_compiled_message(message):
+    """Скомпилированное сообщение из кэша процесса по (id, версия); версия меняется при каждом сохранении."""
+    key = (message.pk, message.version)
+    with _lock:
+        compiled = _compiled_messages.get(key)
+        if compiled is not None:
+            _compiled_messages.move_to_end(key)
+            return compiled
+    compiled = CompiledMessage(message)
+    with _lock:
+        _compiled_messages[key] = compiled
+        while len(_compiled_messages) > settings.MESSAGE_TEMPLATE_CACHE_SIZE:
+            _compiled_messages.popitem(last=False)
+    return compiled
@@ -0,0 +1,151 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from service.cache import bump_versions
+from service.coordination import claim_leadership
+from service.models import Client, MailingDelivery, Segment, SegmentMembership
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = ('email', 'last_name', 'first_name', 'middle_name', 'comment')
+TEXT_OPERATORS = {
+    'equals': 'iexact',
+    'contains': 'icontains',
+    'startswith': 'istartswith',
+    'endswith': 'iendswith',
+}
+EMPTY_OPERATORS = ('empty', 'not_empty')
+
+SENT = [MailingDelivery.StatusOfDelivery.SENT]
+NOT_SENT = [MailingDelivery.StatusOfDelivery.REFUSED, MailingDelivery.StatusOfDelivery.FAILED]
+
+
+def _has_deliveries(statuses, **filters):
+    return Exists(MailingDelivery.objects.filter(client=OuterRef('pk'), status__in=statuses, **filters))
+
+
+def _days_ago(days):
+    return timezone.now() - timedelta(days=days)
+
+
+# условия по истории отправок: значение - число дней или id рассылки
+HISTORY_RULES = {
+    'received_within_days': lambda days: _has_deliveries(SENT, attempted_at__gte=_days_ago(days)),
+    'not_received_within_days': lambda days: ~_has_deliveries(SENT, attempted_at__gte=_days_ago(days)),
+    'refused_within_days': lambda days: _has_deliveries(NOT_SENT, attempted_at__gte=_days_ago(days)),
+    'received_mailing': lambda mailing_id: _has_deliveries(SENT, mailing_id=mailing_id),
+    'not_received_mailing': lambda mailing_id: ~_has_deliveries(SENT, mailing_id=mailing_id),
+}
+
+
+def validate_rules(rules):
+    """
+    Проверяет условия сегмента.
+
+    Условие по полю клиента: {"field": "first_name", "op": "contains", "value": "Иван"}, op - одно из
+    equals, contains, startswith, endswith, empty, not_empty.
+    Условие по истории отправок: {"field": "received_within_days", "value": 30}.
+    """
+    if not isinstance(rules, list):
+        raise ValidationError('Условия задаются списком')
+    for number, rule in enumerate(rules, start=1):
+        if not isinstance(rule, dict):
+            raise ValidationError(f'Условие {number}: ожидается объект')
+        field, operator, value = rule.get('field'), rule.get('op'), rule.get('value')
+        if field in TEXT_FIELDS:
+            if operator not in (*TEXT_OPERATORS, *EMPTY_OPERATORS):
+                raise ValidationError(f'Условие {number}: неизвестная операция {operator}')
+            if operator in TEXT_OPERATORS and not isinstance(value, str):
+                raise ValidationError(f'Условие {number}: значение должно быть строкой')
+        elif field in HISTORY_RULES:
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValidationError(f'Условие {number}: значение должно быть неотрицательным целым числом')
+        else:
+            raise ValidationError(f'Условие {number}: неизвестное поле {field}')
+
+
+def rule_to_q(rule):
+    field, operator, value = rule['field'], rule.get('op'), rule.get('value')
+    if field in HISTORY_RULES:
+        return Q(HISTORY_RULES[field](value))
+    if operator in EMPTY_OPERATORS:
+        empty = Q(**{f'{field}__isnull': True}) | Q(**{field: ''})
+        return empty if operator == 'empty' else ~empty
+    return Q(**{f'{field}__{TEXT_OPERATORS[operator]}': value})
+
+
+def resolve_segment(segment):
+    """Клиенты сегмента, вычисленные по условиям одним запросом (условия по истории - через EXISTS)."""
+    condition = Q()
+    for rule in segment.rules:
+        if segment.match == Segment.MatchOfRules.ANY and condition:
+            condition |= rule_to_q(rule)
+        else:
+            condition &= rule_to_q(rule)
+    return Client.objects.filter(condition, creator_id=segment.creator_id)
+
+
+def materialize_segment(segment, now=None):
+    """
+    Пересчитывает сохраненный состав сегмента двумя запросами INSERT ... SELECT и DELETE по разнице,
+    не перебирая клиентов в Python и не переписывая строки, которые не изменились.
+    """
+    members_sql, members_params = resolve_segment(segment).values('pk').query.sql_with_params()
+    table = SegmentMembership._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE segment_id = %s AND client_id NOT IN ({members_sql})',
+            [segment.pk, *members_params],
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (segment_id, client_id) SELECT %s, members.id FROM ({members_sql}) members '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {table} m WHERE m.segment_id = %s AND m.client_id = members.id)',
+            [segment.pk, *members_params, segment.pk],
+        )
+        segment.materialized_at = now or timezone.now()
+        Segment.objects.filter(pk=segment.pk).update(materialized_at=segment.materialized_at)
+    bump_versions(Segment._meta.label_lower)
+
+
+def is_fresh(segment, now=None):
+    if segment.materialized_at is None:
+        return False
+    return segment.materialized_at > (now or timezone.now()) - timedelta(seconds=settings.SEGMENT_MATERIALIZE_TTL)
+
+
+def get_segment_clients(segment):
+    """
+    Клиенты сегмента.
+
+    Для хранимого сегмента читается таблица состава. Если состав устарел больше чем на SEGMENT_MATERIALIZE_TTL
+    секунд, сегмент вычисляется по условиям, как обычный: функция вызывается из тика планировщика и со страниц,
+    поэтому состав здесь не пересчитывается - это делает только задача ведущего узла.
+    """
+    if not segment.is_materialized or not is_fresh(segment):
+        return resolve_segment(segment)
+    return Client.objects.filter(pk__in=SegmentMembership.objects.filter(segment=segment).values('client_id'))
+
+
+def get_mailing_recipients(mailing):
+    """Получатели рассылки: выбранные вручную клиенты и клиенты сегмента, без повторов, одним запросом."""
+    condition = Q(pk__in=mailing.client_list.values('pk'))
+    if mailing.segment_id is not None:
+        condition |= Q(pk__in=get_segment_clients(mailing.segment).values('pk'))
+    return Client.objects.filter(condition)
+
+
+def refresh_materialized_segments():
+    """Задача планировщика: пересчитывает устаревший состав хранимых сегментов. Выполняется только ведущим узлом."""
+    if not claim_leadership():
+        return
+    now = timezone.now()
+    for segment in Segment.objects.filter(is_materialized=True).iterator():
+        if not is_fresh(segment, now):
+            materialize_segment(segment, now)
+            logger.info('Segment %s materialized', segment.pk)
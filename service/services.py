@@ -1,16 +1,33 @@
 import logging
-import smtplib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from itertools import islice
 
+from django.db import transaction, close_old_connections
+from django.db.models.functions import Mod
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
 from django_apscheduler.jobstores import DjangoJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from django_apscheduler.models import DjangoJobExecution
 from django.conf import settings as django_conf
 
-from config import settings
-from service.models import Mailing, MailingAttempt
+from service import metrics
+from service.cache import bump_versions
+from service.coordination import NODE_ID, claim_leadership, claim_shards
+from service.mail import SMTPConnectionPool, RateLimiter
+from service.outbound import claim_outbound_emails, complete_outbound_email, dispatch_messages, \
+    process_transactional_queue
+from service.partitions import maintain_attempt_partitions
+from service.rendering import RECIPIENT_FIELDS, get_compiled_message, get_recipient_values
+from service.segments import get_mailing_recipients, refresh_materialized_segments
+from service.statistics import record_statistics
+from service.models import Client, Mailing, MailingAttempt, MailingDelivery, OutboundEmail, \
+    MailingDailyStat, TransactionalEmail
 
 logger = logging.getLogger(__name__)
 
@@ -24,23 +41,43 @@ def delete_old_job_executions(max_age=604_800):
     :param max_age: The maximum length of time to retain historical job execution records.
                     Defaults to 7 days.
     """
+    if not claim_leadership():
+        return
     DjangoJobExecution.objects.delete_old_job_executions(max_age)
 
 
+def delete_old_outbound_emails(max_age=604_800):
+    """Удаляет из очереди отправленные письма старше `max_age` секунд (по умолчанию 7 дней)."""
+    if not claim_leadership():
+        return
+    OutboundEmail.objects.filter(
+        status=OutboundEmail.StatusOfOutbound.SENT,
+        available_at__lt=timezone.now() - timedelta(seconds=max_age),
+    ).delete()
+    TransactionalEmail.objects.filter(
+        status__in=[TransactionalEmail.StatusOfOutbound.SENT, TransactionalEmail.StatusOfOutbound.DEAD],
+        created_at__lt=timezone.now() - timedelta(seconds=max_age),
+    ).delete()
+
+
 scheduler = BlockingScheduler(timezone=django_conf.TIME_ZONE)
 
 
 def run_apscheduler():
     scheduler.add_jobstore(DjangoJobStore(), "default")
+    scheduler.add_jobstore(MemoryJobStore(), "local")
 
+    # тик рассылок выполняется на каждом узле по своим шардам, поэтому хранится в памяти процесса,
+    # а не в общем DjangoJobStore
     scheduler.add_job(
-        send_mailing,
+        enqueue_due_mailings,
         trigger=CronTrigger(minute="*/1"),  # Every 1 minute
-        id="send_mailing",  # The `id` assigned to each job MUST be unique
+        id="enqueue_due_mailings",  # The `id` assigned to each job MUST be unique
+        jobstore="local",
         max_instances=1,
         replace_existing=True,
     )
-    logger.info("Added job 'send_mailing'.")
+    logger.info("Added job 'enqueue_due_mailings'.")
 
     scheduler.add_job(
         delete_old_job_executions,
@@ -55,6 +92,41 @@ def run_apscheduler():
         "Added weekly job: 'delete_old_job_executions'."
     )
 
+    scheduler.add_job(
+        delete_old_outbound_emails,
+        trigger=CronTrigger(
+            day_of_week="mon", hour="00", minute="10"
+        ),
+        id="delete_old_outbound_emails",
+        max_instances=1,
+        replace_existing=True,
+    )
+    logger.info(
+        "Added weekly job: 'delete_old_outbound_emails'."
+    )
+
+    scheduler.add_job(
+        maintain_attempt_partitions,
+        trigger=CronTrigger(
+            hour="00", minute="20"
+        ),
+        id="maintain_attempt_partitions",
+        max_instances=1,
+        replace_existing=True,
+    )
+    logger.info(
+        "Added daily job: 'maintain_attempt_partitions'."
+    )
+
+    scheduler.add_job(
+        refresh_materialized_segments,
+        trigger=CronTrigger(minute="*/5"),
+        id="refresh_materialized_segments",
+        max_instances=1,
+        replace_existing=True,
+    )
+    logger.info("Added job 'refresh_materialized_segments'.")
+
     try:
         logger.info("Starting scheduler...")
         scheduler.start()
@@ -64,34 +136,242 @@ def run_apscheduler():
         logger.info("Scheduler shut down successfully!")
 
 
-def send_mailing():
+DELIVERY_WRITE_BATCH = 1000
+
+
+def iter_recipient_batches(mailing, batch_size):
+    """Потоково читает id получателей рассылки и отдает их пачками по `batch_size`."""
+    recipients = get_mailing_recipients(mailing).order_by('pk').values_list('pk', flat=True).iterator(
+        chunk_size=batch_size
+    )
+    while batch := list(islice(recipients, batch_size)):
+        yield batch
+
+
+def build_messages(mailing, recipients):
+    """
+    Собирает письма для пачки получателей (строк values(*RECIPIENT_FIELDS)).
+
+    Сообщение без подстановок уходит одним письмом со скрытой копией (или по письму на получателя в режиме
+    personal), сообщение с подстановками всегда отрисовывается для каждого получателя по скомпилированному шаблону.
+    """
+    compiled = get_compiled_message(mailing.message_to_send)
+    if compiled.is_static and django_conf.MAILING_BATCH_MODE != 'personal':
+        bcc = [recipient['email'] for recipient in recipients]
+        return [EmailMessage(subject=compiled.subject.text, body=compiled.body.text,
+                             from_email=django_conf.EMAIL_HOST_USER, bcc=bcc)]
+    messages = []
+    for recipient in recipients:
+        values = get_recipient_values(recipient)
+        messages.append(EmailMessage(subject=compiled.subject.render(values), body=compiled.body.render(values),
+                                     from_email=django_conf.EMAIL_HOST_USER, to=[recipient['email']]))
+    return messages
+
+
+def build_deliveries(mailing, recipients, attempted_at, result):
+    """Раскладывает результат отправки пачки по получателям."""
+    is_success, server_answer, refused, error_code, unsent = result
+    deliveries = []
+    for client_id, email in recipients:
+        if email in unsent:
+            status, smtp_code = MailingDelivery.StatusOfDelivery.FAILED, error_code
+        elif email in refused:
+            status, smtp_code = MailingDelivery.StatusOfDelivery.REFUSED, refused[email][0]
+        else:
+            status, smtp_code = MailingDelivery.StatusOfDelivery.SENT, 250
+        deliveries.append(MailingDelivery(mailing=mailing, client_id=client_id, attempted_at=attempted_at,
+                                          status=status, smtp_code=smtp_code))
+    return deliveries
+
+
+def claim_due_mailings(current_datetime, shards):
+    """
+    Блокирует наступившие рассылки своих шардов, пропуская занятые другими узлами.
+
+    Вызывается внутри транзакции, в которой расписание рассылок сдвигается.
+    """
+    # выбираются только наступившие отправки по индексу service_mailing_due_idx
+    return list(Mailing.objects.filter(
+        next_run_at__lte=current_datetime,
+        status__in=[Mailing.StatusOfMailing.NEW, Mailing.StatusOfMailing.LAUNCHED],
+    ).annotate(
+        shard=Mod('pk', django_conf.MAILING_SHARDS)
+    ).filter(
+        shard__in=shards
+    ).select_related('frequency', 'message_to_send').select_for_update(
+        skip_locked=True, of=('self',)
+    ).order_by('next_run_at'))
+
+
+def enqueue_mailing(mailing, scheduled_for):
+    """
+    Ставит в очередь отправки пачки получателей одного запуска рассылки.
+
+    Ключ идемпотентности (рассылка, время запуска, номер пачки) не дает поставить пачку дважды.
+    """
+    outbound_emails = []
+    for number, recipients in enumerate(iter_recipient_batches(mailing, django_conf.MAILING_BATCH_SIZE)):
+        outbound_emails.append(OutboundEmail(
+            idempotency_key=f'{mailing.pk}:{scheduled_for.isoformat()}:{number}',
+            mailing=mailing,
+            recipients=recipients,
+            available_at=scheduled_for,
+        ))
+        if len(outbound_emails) >= DELIVERY_WRITE_BATCH:
+            OutboundEmail.objects.bulk_create(outbound_emails, ignore_conflicts=True)
+            outbound_emails.clear()
+    OutboundEmail.objects.bulk_create(outbound_emails, ignore_conflicts=True)
+
+
+def enqueue_occurrences(mailing, current_datetime, catchup_budget):
+    """
+    Ставит в очередь все наступившие запуски рассылки, начиная с next_run_at.
+
+    Запуски, пропущенные больше чем на MAILING_CATCHUP_GRACE секунд (опоздавший тик, перезапуск узла),
+    догоняются, но не больше `catchup_budget` за тик; запуски старше MAILING_CATCHUP_WINDOW не отправляются.
+    Возвращает новое значение next_run_at и число догнанных запусков.
+    """
+    late_before = current_datetime - timedelta(seconds=django_conf.MAILING_CATCHUP_GRACE)
+    skip_before = current_datetime - timedelta(seconds=django_conf.MAILING_CATCHUP_WINDOW)
+    occurrence = mailing.next_run_at
+    caught_up = 0
+    while occurrence <= current_datetime:
+        if occurrence < skip_before:
+            metrics.increment('mailing_misfires_skipped_total')
+            logger.warning('Mailing %s: occurrence %s is too old, skipped', mailing.pk, occurrence)
+        elif occurrence < late_before:
+            if caught_up >= catchup_budget:
+                # остаток догоняется следующими тиками: next_run_at остается в прошлом
+                break
+            enqueue_mailing(mailing, occurrence)
+            metrics.increment('mailing_occurrences_enqueued_total')
+            caught_up += 1
+            metrics.increment('mailing_misfires_total')
+            logger.warning('Mailing %s: missed occurrence %s is caught up', mailing.pk, occurrence)
+        else:
+            enqueue_mailing(mailing, occurrence)
+            metrics.increment('mailing_occurrences_enqueued_total')
+        occurrence = mailing.get_next_run_at(occurrence)
+    return occurrence, caught_up
+
+
+def enqueue_due_mailings():
+    """
+    Тик планировщика: ставит наступившие рассылки в очередь и сдвигает их расписание.
+
+    Постановка в очередь и сдвиг next_run_at выполняются в одной транзакции, поэтому запуск рассылки
+    не теряется при падении узла и не ставится в очередь дважды, даже если шард перешел к другому узлу.
+    """
     current_datetime = timezone.now()
-    logging.warning(f'текущее время: {current_datetime}')
-    # создание объекта с применением фильтра
-    mailings = Mailing.objects.filter(first_sent_at__lte=current_datetime, status__in=['Новая', 'Запущена'])
+    logger.debug('Scheduler tick at %s', current_datetime)
+    try:
+        with metrics.span('tick') as tick:
+            claim_leadership(current_datetime)
+            shards = claim_shards(current_datetime)
+            late_before = current_datetime - timedelta(seconds=django_conf.MAILING_CATCHUP_GRACE)
+            catchup_budget = django_conf.MAILING_CATCHUP_BATCH
+
+            with transaction.atomic():
+                with metrics.span('query', step='claim_mailings') as query:
+                    mailings = claim_due_mailings(current_datetime, shards)
+                    query['mailings'] = len(mailings)
+                metrics.increment('mailings_due_total', len(mailings))
+                # сначала запуски текущего окна, затем догоняемые, чтобы отставание не задерживало текущий тик
+                mailings.sort(key=lambda mailing: mailing.next_run_at < late_before)
+                with metrics.span('persist', step='enqueue'):
+                    for mailing in mailings:
+                        mailing.next_run_at, caught_up = enqueue_occurrences(mailing, current_datetime,
+                                                                             catchup_budget)
+                        catchup_budget -= caught_up
+                        mailing.status = Mailing.StatusOfMailing.LAUNCHED
+                    Mailing.objects.bulk_update(mailings, ['status', 'next_run_at'])
+            if mailings:
+                # bulk_update не вызывает сигналы, поэтому кэш страниц рассылок сбрасывается явно
+                bump_versions(Mailing._meta.label_lower)
+            tick.update(mailings=len(mailings), shards=len(shards))
+    except Exception:
+        metrics.increment('mailing_ticks_total', result='error')
+        raise
+    metrics.increment('mailing_ticks_total', result='ok')
+    metrics.set_gauge('mailing_last_tick_timestamp_seconds', current_datetime.timestamp())
+    logger.info('Enqueued %s due mailings, caught up %s missed occurrences',
+                len(mailings), django_conf.MAILING_CATCHUP_BATCH - catchup_budget)
+
+
+def process_outbound_queue(pool, executor, rate_limiter):
+    """
+    Отправляет одну порцию писем из очереди, возвращает число обработанных писем.
+
+    Рабочие потоки не обращаются к базе: письма собираются здесь, а результаты пишутся одной транзакцией.
+    """
+    with metrics.span('query', step='claim_outbound') as query:
+        outbound_emails = claim_outbound_emails(timezone.now(), django_conf.MAILING_QUEUE_CLAIM)
+        if outbound_emails:
+            client_ids = {client_id for outbound_email in outbound_emails for client_id in outbound_email.recipients}
+            clients = {client['pk']: client
+                       for client in Client.objects.filter(pk__in=client_ids).values(*RECIPIENT_FIELDS)}
+            query.update(emails=len(outbound_emails), clients=len(clients))
+    if not outbound_emails:
+        return 0
+
+    futures = {}
+    for outbound_email in outbound_emails:
+        # клиенты, удаленные после постановки в очередь, пропускаются
+        batch = [clients[client_id] for client_id in outbound_email.recipients if client_id in clients]
+        with metrics.span('render', recipients=len(batch)):
+            messages = build_messages(outbound_email.mailing, batch)
+        recipients = [(client['pk'], client['email']) for client in batch]
+        futures[executor.submit(dispatch_messages, pool, rate_limiter, messages)] = (outbound_email, recipients)
 
     mailing_attempts_to_create = []
-    for mailing in mailings:
-        if (current_datetime.minute == mailing.first_sent_at.minute) and (
-                current_datetime.hour == mailing.first_sent_at.hour) and (
-                (current_datetime - mailing.first_sent_at).days % mailing.frequency.days_until_next_mailing >= 0):
-            if mailing.status == 'Новая':
-                mailing.status = Mailing.StatusOfMailing.LAUNCHED
-                mailing.save()
-            try:
-                server_response = send_mail(
-                    subject=mailing.message_to_send.title,
-                    message=mailing.message_to_send.body,
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[client.email for client in mailing.client_list.all()],
-                    fail_silently=False
-                )
-                mailing_attempts_to_create.append(MailingAttempt(last_attempt=current_datetime, is_success=True,
-                                                                 server_answer=server_response,
-                                                                 mailing=mailing))
-            except smtplib.SMTPException as e:
-                mailing_attempts_to_create.append(MailingAttempt(last_attempt=current_datetime, is_success=False,
-                                                                 server_answer=e,
-                                                                 mailing=mailing))
-
-    MailingAttempt.objects.bulk_create(mailing_attempts_to_create)
+    deliveries_to_create = []
+    for future in as_completed(futures):
+        outbound_email, recipients = futures[future]
+        result = future.result()
+        is_success, server_answer = result[:2]
+        finished_at = timezone.now()
+        complete_outbound_email(outbound_email, is_success, server_answer, finished_at)
+        if outbound_email.status == OutboundEmail.StatusOfOutbound.PENDING:
+            # письма, уже принятые сервером, при повторе не отправляются
+            unsent = result[4]
+            outbound_email.recipients = [client_id for client_id, email in recipients if email in unsent]
+        mailing_attempts_to_create.append(MailingAttempt(last_attempt=finished_at, is_success=is_success,
+                                                         server_answer=server_answer,
+                                                         mailing=outbound_email.mailing))
+        deliveries_to_create.extend(build_deliveries(outbound_email.mailing, recipients, finished_at, result))
+
+    for status, count in Counter(delivery.status for delivery in deliveries_to_create).items():
+        metrics.increment('mailing_recipients_total', count, status=status)
+    with metrics.span('persist', step='results', deliveries=len(deliveries_to_create)), transaction.atomic():
+        OutboundEmail.objects.bulk_update(
+            outbound_emails,
+            ['status', 'attempts', 'available_at', 'locked_by', 'locked_until', 'last_error', 'recipients'],
+        )
+        MailingAttempt.objects.bulk_create(mailing_attempts_to_create)
+        MailingDelivery.objects.bulk_create(deliveries_to_create, batch_size=DELIVERY_WRITE_BATCH)
+        record_statistics(mailing_attempts_to_create, deliveries_to_create)
+    bump_versions(MailingAttempt._meta.label_lower, MailingDailyStat._meta.label_lower)
+    logger.info('Processed %s outbound emails, SMTP pool stats: %s', len(outbound_emails), pool.stats)
+    return len(outbound_emails)
+
+
+def run_queue_worker(stop_event=None):
+    """Цикл обработчика очереди: забирает письма, пока они есть, и опрашивает очередь раз в MAILING_QUEUE_POLL."""
+    stop_event = stop_event or threading.Event()
+    workers = django_conf.MAILING_WORKERS
+    rate_limiter = RateLimiter()
+    logger.info('Starting outbound queue worker %s...', NODE_ID)
+    with SMTPConnectionPool(size=workers) as pool, ThreadPoolExecutor(max_workers=workers) as executor:
+        while not stop_event.is_set():
+            close_old_connections()
+            processed = 0
+            # служебные письма ждет пользователь на сайте, поэтому они отправляются раньше рассылок;
+            # ошибка одной очереди не останавливает другую
+            for name, process_queue in (('transactional', process_transactional_queue),
+                                        ('outbound', process_outbound_queue)):
+                try:
+                    processed += process_queue(pool, executor, rate_limiter)
+                except Exception:
+                    logger.exception('%s queue iteration failed', name.capitalize())
+            if not processed:
+                stop_event.wait(django_conf.MAILING_QUEUE_POLL)
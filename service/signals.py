@@ -0,0 +1,79 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from service.cache import AUTH_VERSION_LABEL, bump_versions, user_version_label
+from service.models import Client, Message, Mailing, MailingAttempt, BlogPost, DashboardCounter, Segment
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=Client)
+@receiver([post_save, post_delete], sender=Message)
+@receiver([post_save, post_delete], sender=Mailing)
+@receiver([post_save, post_delete], sender=MailingAttempt)
+@receiver([post_save, post_delete], sender=BlogPost)
+@receiver([post_save, post_delete], sender=Segment)
+def invalidate_view_cache(sender, **kwargs):
+    bump_versions(sender._meta.label_lower)
+
+
+@receiver(m2m_changed, sender=Mailing.client_list.through)
+def invalidate_mailing_clients(sender, **kwargs):
+    bump_versions(Mailing._meta.label_lower)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_views(sender, instance, **kwargs):
+    bump_versions(user_version_label(instance.pk))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_rights(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_versions(user_version_label(instance.pk))
+    elif pk_set:
+        bump_versions(*(user_version_label(pk) for pk in pk_set))
+    else:
+        # clear() со стороны группы или права: затронутые пользователи неизвестны
+        bump_versions(AUTH_VERSION_LABEL)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+def invalidate_group_rights(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_versions(AUTH_VERSION_LABEL)
+
+
+@receiver(post_save, sender=Mailing)
+def count_saved_mailing(sender, instance, created, **kwargs):
+    is_active = instance.status != Mailing.StatusOfMailing.FINISHED
+    if created:
+        DashboardCounter.increment(DashboardCounter.MAILINGS)
+        was_active = False
+    else:
+        was_active = getattr(instance, '_loaded_status', instance.status) != Mailing.StatusOfMailing.FINISHED
+    if is_active != was_active:
+        DashboardCounter.increment(DashboardCounter.ACTIVE_MAILINGS, 1 if is_active else -1)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Mailing)
+def count_deleted_mailing(sender, instance, **kwargs):
+    DashboardCounter.increment(DashboardCounter.MAILINGS, -1)
+    if instance.status != Mailing.StatusOfMailing.FINISHED:
+        DashboardCounter.increment(DashboardCounter.ACTIVE_MAILINGS, -1)
+
+
+@receiver(post_save, sender=Client)
+def count_saved_client(sender, instance, created, **kwargs):
+    if created:
+        DashboardCounter.increment(DashboardCounter.CLIENTS)
+
+
+@receiver(post_delete, sender=Client)
+def count_deleted_client(sender, instance, **kwargs):
+    DashboardCounter.increment(DashboardCounter.CLIENTS, -1)
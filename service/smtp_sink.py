@@ -0,0 +1,114 @@
+import logging
+import random
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Минимальный диалог SMTP: принимает письма и ничего никуда не отправляет."""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def handle(self):
+        sink = self.server.sink
+        sink.count('connections')
+        self.reply('220 sink ESMTP')
+        recipients = 0
+        while line := self.rfile.readline():
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply('250-sink')
+                self.reply('250 8BITMIME')
+            elif verb in ('HELO', 'NOOP'):
+                self.reply('250 OK')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = 0
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                if sink.random.random() < sink.failure_rate:
+                    sink.count('recipients_refused')
+                    self.reply('550 Mailbox unavailable')
+                else:
+                    recipients += 1
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                if not recipients:
+                    self.reply('503 No valid recipients')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while (data_line := self.rfile.readline()) and data_line != b'.\r\n':
+                    pass
+                if sink.latency:
+                    time.sleep(sink.latency)
+                if sink.reject_after is not None and sink.stats['messages'] >= sink.reject_after:
+                    self.reply('554 Message rejected')
+                    continue
+                sink.count('messages')
+                sink.count('recipients_accepted', recipients)
+                self.reply('250 Queued')
+                if sink.stats['messages'] == sink.disconnect_after:
+                    # обрыв соединения посреди пачки: следующая команда клиента получит разрыв
+                    sink.count('disconnects')
+                    return
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink:
+    """
+    SMTP-сервер в отдельном потоке для нагрузочных проверок отправки.
+
+    `latency` - задержка ответа на каждое письмо в секундах, `failure_rate` - доля отклоняемых получателей (550).
+    `disconnect_after` - после стольких принятых писем сервер один раз рвет соединение,
+    `reject_after` - после стольких принятых писем все следующие отклоняются целиком (554).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, seed=None, disconnect_after=None,
+                 reject_after=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.disconnect_after = disconnect_after
+        self.reject_after = reject_after
+        self.random = random.Random(seed)
+        self.stats = {'connections': 0, 'messages': 0, 'recipients_accepted': 0, 'recipients_refused': 0,
+                      'disconnects': 0}
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), SMTPSinkHandler)
+        self._server.daemon_threads = True
+        self._server.sink = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def start(self):
+        self._thread.start()
+        logger.info('SMTP sink listening on %s:%s', self.host, self.port)
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
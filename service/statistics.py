@@ -0,0 +1,81 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from service.models import MailingDailyStat, MailingDelivery
+
+DELIVERY_FIELDS = {
+    MailingDelivery.StatusOfDelivery.SENT: 'deliveries_sent',
+    MailingDelivery.StatusOfDelivery.REFUSED: 'deliveries_refused',
+    MailingDelivery.StatusOfDelivery.FAILED: 'deliveries_failed',
+}
+
+TOTALS = {field: Sum(field) for field in (
+    'attempts_success', 'attempts_failed', 'deliveries_sent', 'deliveries_refused', 'deliveries_failed',
+)}
+
+
+def record_statistics(attempts, deliveries):
+    """
+    Добавляет результаты отправки к дневным агрегатам рассылок.
+
+    Вызывается обработчиком очереди в транзакции записи попыток: каждая пара (рассылка, день)
+    обновляется одним UPDATE с F-выражениями, строка создается только при первой отправке за день.
+    """
+    increments = defaultdict(Counter)
+    owners = {}
+    for attempt in attempts:
+        key = (attempt.mailing_id, timezone.localdate(attempt.last_attempt))
+        increments[key]['attempts_success' if attempt.is_success else 'attempts_failed'] += 1
+        owners[attempt.mailing_id] = attempt.mailing.creator_id
+    for delivery in deliveries:
+        key = (delivery.mailing_id, timezone.localdate(delivery.attempted_at))
+        increments[key][DELIVERY_FIELDS[delivery.status]] += 1
+        owners[delivery.mailing_id] = delivery.mailing.creator_id
+
+    for (mailing_id, day), counts in increments.items():
+        updates = {field: F(field) + value for field, value in counts.items()}
+        stats = MailingDailyStat.objects.filter(mailing_id=mailing_id, day=day)
+        if stats.update(**updates):
+            continue
+        try:
+            with transaction.atomic():
+                MailingDailyStat.objects.create(mailing_id=mailing_id, owner_id=owners[mailing_id], day=day, **counts)
+        except IntegrityError:
+            # строку за этот день успел создать другой обработчик
+            stats.update(**updates)
+
+
+def with_rates(rows):
+    """Добавляет к строкам агрегатов доли успешных попыток и доставленных писем."""
+    for row in rows:
+        attempts = row['attempts_success'] + row['attempts_failed']
+        deliveries = row['deliveries_sent'] + row['deliveries_refused'] + row['deliveries_failed']
+        row['success_rate'] = round(100 * row['attempts_success'] / attempts, 1) if attempts else None
+        row['delivery_rate'] = round(100 * row['deliveries_sent'] / deliveries, 1) if deliveries else None
+    return rows
+
+
+def get_statistics(user, days=30, limit=50):
+    """Сводки по рассылкам, владельцам и дням, собранные из дневных агрегатов без чтения журнала попыток."""
+    stats = MailingDailyStat.objects.all()
+    if not user.is_superuser:
+        stats = stats.filter(owner=user)
+
+    since = timezone.localdate() - timedelta(days=days - 1)
+    by_day = stats.filter(day__gte=since).values('day').annotate(**TOTALS).order_by('day')
+    by_mailing = stats.values('mailing', 'mailing__message_to_send__title').annotate(**TOTALS).order_by(
+        '-attempts_success', 'mailing'
+    )[:limit]
+    statistics = {
+        'days': days,
+        'by_day': with_rates(list(by_day)),
+        'by_mailing': with_rates(list(by_mailing)),
+    }
+    if user.is_superuser:
+        by_owner = stats.values('owner', 'owner__email').annotate(**TOTALS).order_by('-attempts_success', 'owner')
+        statistics['by_owner'] = with_rates(list(by_owner[:limit]))
+    return statistics
@@ -1,3 +1,410 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.test import Client as TestClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from service import metrics
+from service.benchmark import run_benchmark
+from service.blog import get_random_blog_posts
+from service.coordination import claim_shards
+from service.imports import import_clients
+from service.mail import RateLimiter, SMTPConnectionPool
+from service.models import Client, Message, Mailing, MailingAttempt, Frequency, BlogPost, TransactionalEmail, \
+    Segment, SegmentMembership
+from service.outbound import dispatch_messages, process_transactional_queue
+from service.partitions import archive_old_attempts
+from service.profiling import ProfileAggregator, RequestProfile, request_profiler
+from service.segments import get_segment_clients
+from service.services import run_queue_worker
+from service.smtp_sink import SMTPSink
+from service.view_counter import ViewCounterBuffer
+from users.models import User
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTestCase(TestCase):
+    """Число запросов на страницу не должно зависеть от количества строк и связей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='owner@test.ru', is_superuser=True, is_staff=True)
+        cls.frequency = Frequency.objects.create(name='Ежедневно', days_until_next_mailing=1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def seed(self, count):
+        clients = Client.objects.bulk_create(
+            Client(email=f'client{Client.objects.count() + i}@test.ru', first_name='Клиент', creator=self.user)
+            for i in range(count)
+        )
+        message = Message.objects.create(title='Тема', body='Тело', creator=self.user)
+        for _ in range(count):
+            mailing = Mailing.objects.create(first_sent_at=timezone.now(), frequency=self.frequency,
+                                             message_to_send=message, creator=self.user)
+            mailing.client_list.set(clients)
+            MailingAttempt.objects.create(is_success=True, server_answer='1', mailing=mailing)
+            BlogPost.objects.create(title='Пост', body='Текст', creator=self.user)
+        return mailing
+
+    def assertQueryBudget(self, url_factory, budget):
+        self.seed(2)
+        url = url_factory()
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.seed(10)
+        url = url_factory()
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(large), len(small), 'query count grows with the amount of data')
+        self.assertLessEqual(len(large), budget)
+
+    def test_main(self):
+        self.assertQueryBudget(lambda: '/', 6)
+
+    def test_random_blog_posts_with_pk_gaps(self):
+        posts = BlogPost.objects.bulk_create(BlogPost(title='Пост', body='Текст') for _ in range(20))
+        BlogPost.objects.filter(pk__in=[post.pk for post in posts[1:-1]]).delete()
+        for _ in range(10):
+            with self.assertNumQueries(2):
+                self.assertEqual(len({post.pk for post in get_random_blog_posts(2)}), 2)
+
+    def test_mailing_list(self):
+        self.assertQueryBudget(lambda: '/mailings/', 3)
+
+    def test_mailing_detail(self):
+        self.assertQueryBudget(lambda: f'/mailings/{Mailing.objects.latest("pk").pk}/', 4)
+
+    def test_client_list(self):
+        self.assertQueryBudget(lambda: '/clients/', 3)
+
+    def test_message_list(self):
+        self.assertQueryBudget(lambda: '/messages/', 3)
+
+    def test_attempt_list(self):
+        self.assertQueryBudget(lambda: '/attempts/', 3)
+
+    def test_blog_list(self):
+        self.assertQueryBudget(lambda: '/blog/', 3)
+
+    def test_attempt_detail(self):
+        self.assertQueryBudget(lambda: f'/attempts/{MailingAttempt.objects.latest("pk").pk}/', 3)
+
+    def test_mailing_update(self):
+        self.assertQueryBudget(lambda: f'/mailings/update/{Mailing.objects.latest("pk").pk}/', 11)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ViewCacheTestCase(TestCase):
+    """Кэш страниц не отдает одному браузеру страницу, отрисованную для другого."""
+
+    def setUp(self):
+        self.user = User.objects.create(email='cached@test.ru', is_superuser=True, is_staff=True)
+
+    def browser(self):
+        browser = TestClient(enforce_csrf_checks=True)
+        browser.force_login(self.user)
+        for _ in range(3):
+            response = browser.get(reverse('service:clients'))
+        return browser, re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode())[1]
+
+    def test_logout_token_matches_browser(self):
+        self.browser()
+        browser, token = self.browser()
+        response = browser.post(reverse('users:logout'), {'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+    def test_user_change_invalidates_pages(self):
+        browser, _ = self.browser()
+        with CaptureQueriesContext(connection) as cached:
+            browser.get(reverse('service:clients'))
+        self.user.is_banned = True
+        self.user.save()
+        with CaptureQueriesContext(connection) as rendered:
+            browser.get(reverse('service:clients'))
+        self.assertGreater(len(rendered), len(cached))
+
+
+@override_settings(MAILING_SHARDS=16)
+class ShardLeaseTestCase(TestCase):
+    """Шарды делятся между живыми узлами поровну."""
+
+    def test_new_node_gets_fair_share(self):
+        self.assertEqual(len(claim_shards(node_id='first')), 16)
+        # новый узел учитывается сразу, но шарды получает, когда старый их отдаст
+        self.assertEqual(claim_shards(node_id='second'), [])
+        first = claim_shards(node_id='first')
+        second = claim_shards(node_id='second')
+        self.assertEqual((len(first), len(second)), (8, 8))
+        self.assertEqual(set(first) | set(second), set(range(16)))
+
+
+class ViewCounterTestCase(TestCase):
+    """Буфер просмотров сбрасывается по таймеру, даже если просмотров больше нет."""
+
+    def test_flush_without_new_views(self):
+        buffer = ViewCounterBuffer(flush_interval=0.01, flush_size=100)
+        flushed = threading.Event()
+
+        def flush():
+            if threading.current_thread().name == 'blog-view-flusher':
+                flushed.set()
+
+        with mock.patch.object(buffer, 'flush', side_effect=flush):
+            buffer.add(1)
+            self.assertTrue(flushed.wait(5))
+            # поток останавливается до снятия заглушки, чтобы не сбрасывать буфер в базу после теста
+            buffer.stop()
+
+    def test_failed_flush_is_not_counted_twice(self):
+        posts = [BlogPost.objects.create(title=f'Пост {i}', body='Текст') for i in range(2)]
+        buffer = ViewCounterBuffer(flush_interval=3600, flush_size=100)
+        self.addCleanup(buffer.stop)
+        buffer.add(posts[0].pk)
+        for _ in range(2):
+            buffer.add(posts[1].pk)
+        update = QuerySet.update
+        calls = []
+
+        def fail_second_update(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise DatabaseError('connection lost')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=fail_second_update), \
+                self.assertLogs('service.view_counter', 'ERROR'):
+            buffer.flush()
+        buffer.flush()
+        self.assertEqual(sorted(BlogPost.objects.values_list('view_count', flat=True)), [1, 2])
+
+
+class AttemptArchiveTestCase(TestCase):
+    """Старые попытки выгружаются в архив и удаляются из базы."""
+
+    def setUp(self):
+        user = User.objects.create(email='archive@test.ru')
+        frequency = Frequency.objects.create(name='Ежедневно', days_until_next_mailing=1)
+        message = Message.objects.create(title='Тема', body='Тело', creator=user)
+        mailing = Mailing.objects.create(first_sent_at=timezone.now(), frequency=frequency,
+                                         message_to_send=message, creator=user)
+        old, self.recent = (MailingAttempt.objects.create(is_success=True, server_answer='1', mailing=mailing)
+                            for _ in range(2))
+        MailingAttempt.objects.filter(pk=old.pk).update(last_attempt=timezone.now() - timedelta(days=800))
+
+    def assertArchived(self, paths):
+        with gzip.open(paths[-1], 'rt') as file:
+            self.assertEqual(len(file.readlines()), 2)
+        self.assertEqual(list(MailingAttempt.objects.values_list('pk', flat=True)), [self.recent.pk])
+
+    def test_archive_old_attempts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = archive_old_attempts(retention_months=12, archive_dir=os.path.join(directory, 'attempts'))
+            self.assertArchived(paths)
+
+    def test_archive_default_partition(self):
+        # попытка за месяц без своей секции лежит в секции по умолчанию и архивируется после старых секций
+        partitions = {timezone.now() - timedelta(days=800): 'service_mailingattempt_p_old'}
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('service.partitions.is_partitioned', return_value=True), \
+                mock.patch('service.partitions.get_partitions', return_value=partitions), \
+                mock.patch('service.partitions.archive_partition', return_value='partition.csv.gz') as partition:
+            paths = archive_old_attempts(retention_months=12, archive_dir=os.path.join(directory, 'attempts'))
+            partition.assert_called_once()
+            self.assertEqual(len(paths), 2)
+            self.assertArchived(paths)
+
+
+class ClientImportTestCase(TestCase):
+    """Импорт создает и обновляет только клиентов владельца."""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='importer@test.ru')
+        self.stranger = User.objects.create(email='stranger@test.ru')
+        Client.objects.create(email='mine@test.ru', first_name='Old', creator=self.owner)
+        Client.objects.create(email='foreign@test.ru', first_name='Foreign', creator=self.stranger)
+
+    def test_import(self):
+        rejected = {}
+        lines = [
+            'email,first_name,city',
+            'new@test.ru,New,Moscow',
+            'mine@test.ru,Updated,Kazan',
+            'foreign@test.ru,Hijacked,Omsk',
+            'not-an-email,Broken,',
+        ]
+        stats = import_clients(lines, 'csv', self.owner,
+                               on_reject=lambda number, errors: rejected.setdefault(number, errors))
+        self.assertEqual(stats, {'processed': 4, 'created': 1, 'updated': 1, 'rejected': 2})
+        self.assertEqual(sorted(rejected), [4, 5])
+        self.assertEqual(Client.objects.get(email='new@test.ru').creator, self.owner)
+        mine = Client.objects.get(email='mine@test.ru')
+        self.assertEqual((mine.first_name, mine.extra), ('Updated', {'city': 'Kazan'}))
+        foreign = Client.objects.get(email='foreign@test.ru')
+        self.assertEqual((foreign.first_name, foreign.creator), ('Foreign', self.stranger))
+
+
+class SegmentTestCase(TestCase):
+    """Чтение устаревшего хранимого сегмента ничего не пишет в базу."""
+
+    def test_stale_segment_is_resolved_without_writes(self):
+        user = User.objects.create(email='segments@test.ru')
+        Client.objects.create(email='ivan@test.ru', first_name='Ivan', creator=user)
+        Client.objects.create(email='petr@test.ru', first_name='Petr', creator=user)
+        segment = Segment.objects.create(name='Ivan', creator=user, is_materialized=True,
+                                         rules=[{'field': 'first_name', 'op': 'contains', 'value': 'Iv'}])
+        self.assertEqual([client.email for client in get_segment_clients(segment)], ['ivan@test.ru'])
+        self.assertFalse(SegmentMembership.objects.exists())
+        self.assertIsNone(Segment.objects.get(pk=segment.pk).materialized_at)
+
+
+class SMTPDeliveryTestCase(TestCase):
+    """Письма, уже принятые сервером, не отправляются повторно."""
+
+    def deliver(self, sink):
+        messages = [EmailMessage('Тема', 'Текст', 'from@test.ru', [f'r{i}@test.ru']) for i in range(5)]
+        connection_kwargs = {'backend': 'django.core.mail.backends.smtp.EmailBackend', 'host': sink.host,
+                             'port': sink.port, 'username': '', 'password': '', 'use_tls': False, 'use_ssl': False}
+        with SMTPConnectionPool(size=1, **connection_kwargs) as pool:
+            return dispatch_messages(pool, RateLimiter(0), messages)
+
+    def test_reconnect_sends_only_remainder(self):
+        with SMTPSink(disconnect_after=2) as sink:
+            is_success, _, _, _, unsent = self.deliver(sink)
+        self.assertTrue(is_success)
+        self.assertEqual(unsent, set())
+        self.assertEqual((sink.stats['disconnects'], sink.stats['messages']), (1, 5))
+
+    def test_failure_reports_unsent_remainder(self):
+        with SMTPSink(reject_after=2) as sink:
+            is_success, _, _, smtp_code, unsent = self.deliver(sink)
+        self.assertFalse(is_success)
+        self.assertEqual(smtp_code, 554)
+        self.assertEqual(unsent, {'r2@test.ru', 'r3@test.ru', 'r4@test.ru'})
+
+
+class DispatchTestCase(TestCase):
+    """Сквозная отправка через локальный SMTP-сервер: тик планировщика и обработчик очереди."""
+
+    def test_every_recipient_reaches_smtp(self):
+        results = run_benchmark(users=2, clients=30, mailings=2, failure_rate=0.1, seed_value=1)['results']
+        smtp = results['smtp']
+        self.assertEqual(results['outbound_dead'], 0)
+        self.assertEqual(smtp['recipients_accepted'] + smtp['recipients_refused'], 2 * 30 * 2)
+        self.assertEqual(results['deliveries'], 2 * 30 * 2)
+
+    def test_queries_do_not_grow_with_audience(self):
+        # первый прогон создает аренды планировщика, сравниваются последующие
+        run_benchmark(users=1, clients=10, mailings=2)
+        small = run_benchmark(users=1, clients=10, mailings=2)['results']
+        large = run_benchmark(users=1, clients=90, mailings=2)['results']
+        self.assertEqual(large['tick_queries'], small['tick_queries'])
+
+    def test_metrics_follow_dispatch(self):
+        results = run_benchmark(users=1, clients=20, mailings=2)['results']
+        self.assertEqual(set(results['stages']), {'tick', 'query', 'persist', 'render', 'smtp_connect', 'send'})
+        counters = metrics.get_counters()
+        self.assertEqual(counters['mailings_due_total'], 2)
+        self.assertEqual(counters['outbound_emails_total'], results['outbound_emails'])
+        self.assertEqual(counters['mailing_recipients_total'], results['deliveries'])
+        exposition = metrics.render()
+        self.assertIn('mailing_ticks_total{result="ok"} 1', exposition)
+        self.assertIn('mailing_stage_duration_seconds_count{stage="send"}', exposition)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProfilingTestCase(TestCase):
+    """Профилирующий middleware сводит замеры запросов по имени маршрута."""
+
+    def setUp(self):
+        self.user = User.objects.create(email='profiled@test.ru', is_superuser=True, is_staff=True)
+        self.client.force_login(self.user)
+        request_profiler.snapshot(reset=True)
+
+    def test_views_are_profiled(self):
+        # первый ответ выдает CSRF-куку, с которой страница кэшируется вторым и отдается из кэша третьим
+        for _ in range(3):
+            self.client.get(reverse('service:clients'))
+        row = next(row for row in request_profiler.snapshot()['views'] if row['view'] == 'service:clients')
+        self.assertEqual(row['count'], 3)
+        self.assertGreater(row['sql_count_max'], 0)
+        self.assertGreater(row['template_time_max'], 0)
+        self.assertGreater(row['cache_hits_avg'], 0)
+        self.assertGreater(row['cache_misses_avg'], 0)
+
+    def test_dump_is_written_per_process_in_background(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = ProfileAggregator(dump_interval=0.01, dump_path=os.path.join(directory, 'profile.json'))
+            profiler.add('service:index', RequestProfile(), 200)
+            path = os.path.join(directory, f'profile.{os.getpid()}.json')
+            for _ in range(500):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.01)
+            with open(path, encoding='utf-8') as file:
+                self.assertEqual(json.load(file)['views'][0]['view'], 'service:index')
+
+
+class TransactionalEmailTestCase(TestCase):
+    """Письма регистрации отправляет обработчик очереди, а не запрос."""
+
+    def setUp(self):
+        response = self.client.post(reverse('users:register'), {
+            'email': 'new@test.ru', 'password1': 'Str0ng-passw0rd', 'password2': 'Str0ng-passw0rd',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+        self.email = TransactionalEmail.objects.get()
+
+    def process(self, sink):
+        connection_kwargs = {'backend': 'django.core.mail.backends.smtp.EmailBackend', 'host': sink.host,
+                             'port': sink.port, 'username': '', 'password': '', 'use_tls': False, 'use_ssl': False}
+        with SMTPConnectionPool(size=1, **connection_kwargs) as pool, ThreadPoolExecutor(max_workers=1) as executor:
+            return process_transactional_queue(pool, executor, RateLimiter(0))
+
+    def test_email_is_sent_by_worker(self):
+        with SMTPSink() as sink:
+            self.assertEqual(self.process(sink), 1)
+            self.assertEqual(sink.stats['recipients_accepted'], 1)
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, TransactionalEmail.StatusOfOutbound.SENT)
+        self.assertEqual(self.email.body, '')
+
+    def test_failed_email_is_retried(self):
+        with SMTPSink() as sink:
+            pass
+        # сервер уже остановлен, подключение не удается
+        self.assertEqual(self.process(sink), 1)
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, TransactionalEmail.StatusOfOutbound.PENDING)
+        self.assertEqual(self.email.attempts, 1)
+        self.assertGreater(self.email.available_at, timezone.now())
+        self.assertIn('email-confirm', self.email.body)
+
+    def test_failing_queue_does_not_block_other(self):
+        stop_event = threading.Event()
+
+        def process_outbound_queue(*args):
+            stop_event.set()
+            return 0
+
+        with mock.patch('service.services.process_transactional_queue', side_effect=DatabaseError), \
+                mock.patch('service.services.process_outbound_queue', side_effect=process_outbound_queue) as outbound:
+            run_queue_worker(stop_event)
+        outbound.assert_called_once()
@@ -0,0 +1,101 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+
+from service.models import BlogPost
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounterBuffer:
+    """
+    Буфер просмотров постов блога в памяти процесса.
+
+    Просмотры не пишутся в базу по одному, а копятся и сбрасываются раз в `flush_interval` секунд
+    или после `flush_size` просмотров. Сброс прибавляет накопленное через F(), поэтому несколько
+    веб-процессов со своими буферами не затирают счетчики друг друга, а популярный пост получает
+    одно обновление за интервал вместо блокировки строки на каждый просмотр.
+
+    С первым просмотром в процессе запускается фоновый поток, который сбрасывает буфер по таймеру,
+    поэтому просмотры на редко посещаемом сервере не копятся до следующего запроса и не теряются
+    при аварийном завершении процесса, когда atexit не выполняется.
+    """
+
+    def __init__(self, flush_interval=None, flush_size=None):
+        self.flush_interval = settings.BLOG_VIEW_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.flush_size = settings.BLOG_VIEW_FLUSH_SIZE if flush_size is None else flush_size
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._pending_total = 0
+        self._flushed_at = time.monotonic()
+        self._flusher_pid = None
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    def _ensure_flusher(self):
+        # поток запускается в том процессе, который считает просмотры: после fork потоков родителя нет
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._run_flusher, name='blog-view-flusher', daemon=True)
+        self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Blog view counters flush failed')
+            finally:
+                # у потока свое соединение с базой, между сбросами оно не держится открытым
+                connection.close()
+
+    def stop(self):
+        """Останавливает фоновый поток сброса и дожидается его завершения."""
+        self._stopped.set()
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            self._flusher.join()
+
+    def add(self, pk):
+        with self._lock:
+            self._ensure_flusher()
+            self._pending[pk] += 1
+            self._pending_total += 1
+            should_flush = (self._pending_total >= self.flush_size
+                            or time.monotonic() - self._flushed_at >= self.flush_interval)
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_total = 0
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+
+        # посты с одинаковым приростом обновляются одним запросом
+        posts_by_increment = defaultdict(list)
+        for pk, increment in pending.items():
+            posts_by_increment[increment].append(pk)
+        # обновления в одной транзакции: при ошибке откатываются все, и возвращенный в буфер прирост не учтется дважды
+        try:
+            with transaction.atomic():
+                for increment, pks in posts_by_increment.items():
+                    BlogPost.objects.filter(pk__in=pks).update(view_count=F('view_count') + increment)
+        except DatabaseError:
+            logger.exception('Failed to flush blog view counters, keeping them for the next flush')
+            with self._lock:
+                self._pending.update(pending)
+                self._pending_total += sum(pending.values())
+
+
+blog_view_counter = ViewCounterBuffer()
+atexit.register(blog_view_counter.flush)
@@ -1,10 +1,25 @@
+import io
+
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.db.models import Count
+from django.http import StreamingHttpResponse, HttpResponseBadRequest, Http404
 from django.urls import reverse_lazy
-from django.views.generic import ListView, DetailView, UpdateView, CreateView, DeleteView, TemplateView
+from django.views.generic import ListView, DetailView, UpdateView, CreateView, DeleteView, TemplateView, FormView, \
+    View
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-from service.forms import MessageForm, ClientForm, MailingForm, BlogPostForm
-from service.models import MailingAttempt, Message, Mailing, Client, BlogPost
+from service.forms import MessageForm, ClientForm, MailingForm, MailingModeratorForm, BlogPostForm, ClientImportForm, \
+    ExportFilterForm, SegmentForm
+from service.blog import get_random_blog_posts, get_popular_blog_posts
+from service.exports import EXPORTS, get_export_rows, iter_export
+from service.imports import guess_format, import_clients
+from service.mixins import KeysetPaginationMixin
+from service.models import MailingAttempt, Message, Mailing, Client, BlogPost, DashboardCounter, Segment
+from service.segments import get_segment_clients
+from users.models import User
+from service.statistics import get_statistics
+from service.view_counter import blog_view_counter
 
 
 class MainView(LoginRequiredMixin, TemplateView):
@@ -13,38 +28,67 @@ class MainView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, *args, **kwargs):
         context_data = super().get_context_data(*args, **kwargs)
 
-        mailing_count = Mailing.objects.all().count()
-        mailing_active_count = Mailing.objects.exclude(status="Завершена").count()
-        client_unique = Client.objects.all().distinct().count()
-        blog_random = BlogPost.objects.order_by('?')[:3]
+        # счетчики поддерживаются сигналами при изменении рассылок и клиентов, а не пересчитываются
+        counters = DashboardCounter.get_values()
+        mailing_count = counters.get(DashboardCounter.MAILINGS, 0)
+        mailing_active_count = counters.get(DashboardCounter.ACTIVE_MAILINGS, 0)
+        client_unique = counters.get(DashboardCounter.CLIENTS, 0)
+        blog_random = get_random_blog_posts(3)
+        blog_popular = get_popular_blog_posts(5)
 
         context_data["mailing_count"] = mailing_count
         context_data["mailing_active_count"] = mailing_active_count
         context_data["client_unique"] = client_unique
         context_data["blog_posts"] = blog_random
+        context_data["blog_popular"] = blog_popular
+
+        return context_data
+
+
+class StatisticsView(LoginRequiredMixin, TemplateView):
+    template_name = 'service/statistics.html'
 
+    def get_context_data(self, *args, **kwargs):
+        context_data = super().get_context_data(*args, **kwargs)
+        context_data.update(get_statistics(self.request.user))
         return context_data
 
 
-class MailingAttemptList(LoginRequiredMixin, ListView):
+class MailingAttemptList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = MailingAttempt
+    seek_field = 'last_attempt'
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('mailing')
+        user = self.request.user
+        if user.is_superuser:
+            return queryset
+        return queryset.filter(mailing__creator=user)
 
 
 class MailingAttemptDetailView(LoginRequiredMixin, DetailView):
     model = MailingAttempt
+    queryset = MailingAttempt.objects.select_related('mailing')
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
         context = self.get_context_data(object=self.object)
         user = self.request.user
-        if user == self.object.creator or user.is_superuser:
+        if user.pk == self.object.mailing.creator_id or user.is_superuser:
             return self.render_to_response(context)
         raise PermissionDenied
 
 
-class MessageList(LoginRequiredMixin, ListView):
+class MessageList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Message
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_superuser:
+            return queryset
+        return queryset.filter(creator=user)
+
 
 class MessageDetailView(LoginRequiredMixin, DetailView):
     model = Message
@@ -99,9 +143,16 @@ class MessageUpdateView(LoginRequiredMixin, UpdateView):
         raise PermissionDenied
 
 
-class ClientList(LoginRequiredMixin, ListView):
+class ClientList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Client
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_superuser:
+            return queryset
+        return queryset.filter(creator=user)
+
 
 class ClientDetailView(LoginRequiredMixin, DetailView):
     model = Client
@@ -134,6 +185,30 @@ class ClientCreateView(LoginRequiredMixin, CreateView):
         return super().get_form_class()
 
 
+class ClientImportView(LoginRequiredMixin, FormView):
+    template_name = 'service/client_import.html'
+    form_class = ClientImportForm
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated and request.user.is_banned:
+            raise PermissionDenied
+        return super().dispatch(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        file_format = form.cleaned_data['file_format'] or guess_format(upload.name)
+        rejected = []
+
+        def collect_rejected(number, errors):
+            # показываются только первые отклоненные строки, чтобы память не росла с размером файла
+            if len(rejected) < settings.CLIENT_IMPORT_REJECTED_SHOWN:
+                rejected.append((number, errors))
+
+        lines = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+        stats = import_clients(lines, file_format, self.request.user, on_reject=collect_rejected)
+        return self.render_to_response(self.get_context_data(form=form, stats=stats, rejected=rejected))
+
+
 class ClientDeleteView(LoginRequiredMixin, DeleteView):
     model = Client
     success_url = reverse_lazy('service:clients')
@@ -156,12 +231,90 @@ class ClientUpdateView(LoginRequiredMixin, UpdateView):
         raise PermissionDenied
 
 
-class MailingList(LoginRequiredMixin, ListView):
+class SegmentList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    model = Segment
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_superuser:
+            return queryset
+        return queryset.filter(creator=user)
+
+
+class SegmentDetailView(LoginRequiredMixin, DetailView):
+    model = Segment
+    sample_size = 20
+
+    def get_context_data(self, **kwargs):
+        context_data = super().get_context_data(**kwargs)
+        clients = get_segment_clients(self.object)
+        context_data['client_count'] = clients.count()
+        context_data['clients'] = clients.order_by('pk')[:self.sample_size]
+        return context_data
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        user = self.request.user
+        if user == self.object.creator or user.is_superuser:
+            return self.render_to_response(self.get_context_data(object=self.object))
+        raise PermissionDenied
+
+
+class SegmentCreateView(LoginRequiredMixin, CreateView):
+    model = Segment
+    success_url = reverse_lazy('service:segments')
+    form_class = SegmentForm
+
+    def form_valid(self, form):
+        form.instance.creator = self.request.user
+        return super().form_valid(form)
+
+    def get_form_class(self):
+        user = self.request.user
+        if user.is_banned:
+            raise PermissionDenied
+        return super().get_form_class()
+
+
+class SegmentUpdateView(LoginRequiredMixin, UpdateView):
+    model = Segment
+    success_url = reverse_lazy('service:segments')
+
+    def get_form_class(self):
+        user = self.request.user
+        if (user == self.object.creator or user.is_superuser) and not user.is_banned:
+            return SegmentForm
+        raise PermissionDenied
+
+
+class SegmentDeleteView(LoginRequiredMixin, DeleteView):
+    model = Segment
+    success_url = reverse_lazy('service:segments')
+
+    def get_form_class(self):
+        user = self.request.user
+        if (user == self.object.creator or user.is_superuser) and not user.is_banned:
+            return super().get_form_class()
+        raise PermissionDenied
+
+
+class MailingList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Mailing
 
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('frequency', 'message_to_send', 'segment').annotate(
+            client_count=Count('client_list')
+        )
+        user = self.request.user
+        if user.is_superuser or user.has_perm('service.can_view_all_mailings'):
+            return queryset
+        return queryset.filter(creator=user)
+
 
 class MailingDetailView(LoginRequiredMixin, DetailView):
     model = Mailing
+    queryset = Mailing.objects.select_related('frequency', 'message_to_send', 'creator', 'segment')
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
@@ -214,19 +367,27 @@ class MailingUpdateView(LoginRequiredMixin, UpdateView):
 
     def get_form_class(self):
         user = self.request.user
-        if user == (self.object.creator or user.is_superuser) and not user.is_banned:
+        if (user == self.object.creator or user.is_superuser) and not user.is_banned:
             return MailingForm
         if user.has_perm('service.can_change_status'):
-            return MailingForm
+            return MailingModeratorForm
         raise PermissionDenied
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        if self.get_form_class() is MailingForm:
+            kwargs['request'] = self.request
+        return kwargs
 
-class BlogPostList(LoginRequiredMixin, ListView):
+
+class BlogPostList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = BlogPost
+    queryset = BlogPost.objects.select_related('creator')
 
 
 class BlogPostDetailView(LoginRequiredMixin, DetailView):
     model = BlogPost
+    queryset = BlogPost.objects.select_related('creator')
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
@@ -234,6 +395,7 @@ class BlogPostDetailView(LoginRequiredMixin, DetailView):
         user = self.request.user
         if (user == self.object.creator or user.is_superuser or user.has_perm(
                 'can_view_blog_posts')) and not user.is_banned:
+            blog_view_counter.add(self.object.pk)
             return self.render_to_response(context)
         raise PermissionDenied
 
@@ -279,3 +441,45 @@ class BlogPostUpdateView(LoginRequiredMixin, UpdateView):
                 'can_edit_BlogPost')) and not user.is_banned:
             return BlogPostForm
         raise PermissionDenied
+
+
+class ExportView(LoginRequiredMixin, View):
+    """
+    Потоковая выгрузка клиентов, рассылок или попыток в CSV/JSONL.
+
+    Ответ начинает отдаваться сразу, строки читаются из базы пачками и не накапливаются в памяти.
+    Пользователь выгружает только свои данные, выгрузить чужие (?owner=email) может тот, кто видит их в списках.
+    """
+    content_types = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+    def can_view_all(self, name):
+        user = self.request.user
+        if name == 'mailings':
+            return user.is_superuser or user.has_perm('service.can_view_all_mailings')
+        return user.is_superuser
+
+    def get(self, request, name):
+        if name not in EXPORTS:
+            raise Http404
+        form = ExportFilterForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        owner_email = form.cleaned_data['owner']
+        if not self.can_view_all(name):
+            if owner_email and owner_email != request.user.email:
+                raise PermissionDenied
+            owner = request.user
+        elif owner_email:
+            owner = User.objects.filter(email=owner_email).first()
+            if owner is None:
+                raise Http404
+        else:
+            owner = None
+
+        file_format = form.cleaned_data['format'] or 'csv'
+        rows = get_export_rows(name, owner=owner, date_from=form.cleaned_data['date_from'],
+                               date_to=form.cleaned_data['date_to'])
+        response = StreamingHttpResponse(iter_export(name, rows, file_format),
+                                         content_type=f'{self.content_types[file_format]}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{name}.{file_format}"'
+        return response
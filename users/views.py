@@ -4,11 +4,13 @@ import string
 from django.http import HttpResponseRedirect
 from django.contrib.auth.views import PasswordResetView
 from django.shortcuts import get_object_or_404, redirect
-from django.core.mail import send_mail
+from django.db import transaction
 from django.urls import reverse_lazy, reverse
 from django.views.generic import CreateView, UpdateView, ListView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 
+from service.mixins import KeysetPaginationMixin
+from service.outbound import send_transactional_email
 from users.forms import UserRegisterForm, UserProfileForm, RecoveryForm, UserUpdateForm
 from users.models import User
 
@@ -21,6 +23,7 @@ class RegisterView(CreateView):
     template_name = 'users/register.html'
     success_url = reverse_lazy('users:login')
 
+    @transaction.atomic
     def form_valid(self, form):
         user = form.save()
         user.is_active = False
@@ -29,7 +32,7 @@ class RegisterView(CreateView):
         user.save()
         host = self.request.get_host()
         url = f'http://{host}/users/email-confirm/{token}/'
-        send_mail(
+        send_transactional_email(
             subject="Подтверждение почты",
             message=f"Привет, перейди по ссылке для подтверждения почты {url}",
             from_email=EMAIL_HOST_USER,
@@ -64,19 +67,20 @@ class UserPasswordResetView(PasswordResetView):
             user = form.cleaned_data['email']
             character = string.ascii_letters + string.digits
             password = "".join(secrets.choice(character) for i in range(12))
-            user.set_password(password)
-            user.save()
-            send_mail(
-                subject="Восстановление пароля SkyStore",
-                message=f"Ваш пароль {password}",
-                from_email=EMAIL_HOST_USER,
-                recipient_list=[user.email]
-            )
+            with transaction.atomic():
+                user.set_password(password)
+                user.save()
+                send_transactional_email(
+                    subject="Восстановление пароля SkyStore",
+                    message=f"Ваш пароль {password}",
+                    from_email=EMAIL_HOST_USER,
+                    recipient_list=[user.email]
+                )
             return HttpResponseRedirect(reverse('users:login'))
         return super().form_valid(form)
 
 
-class UserList(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class UserList(LoginRequiredMixin, PermissionRequiredMixin, KeysetPaginationMixin, ListView):
     model = User
     permission_required = 'users.can_view_all_users'
 